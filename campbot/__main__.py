@@ -2,10 +2,11 @@
 CampBot, Python bot framework for camptocamp.org
 
 Usage:
-  campbot check_rc <days> [--login=<login>] [--password=<password>] [--delay=<seconds>] [--batch]
-  campbot clean <url_or_file> <langs> [--login=<login>] [--password=<password>] [--delay=<seconds>] [--batch] [--bbcode]
-  campbot contribs [--out=<filename>] [--starts=<start_date>] [--ends=<end_date>] [--delay=<seconds>]
-  campbot export <url> [--out=<filename>] [--delay=<seconds>]
+  campbot check_rc <days> [--login=<login>] [--password=<password>] [--delay=<seconds>] [--batch] [--cache=<dir>] [--workers=<count>] [--metrics=<filename>] [--record=<filename>|--replay=<filename> [--replay-latency=<factor>]]
+  campbot watch [--interval=<seconds>] [--cursor=<filename>] [--login=<login>] [--password=<password>] [--delay=<seconds>] [--batch] [--cache=<dir>] [--workers=<count>] [--metrics=<filename>]
+  campbot clean <url_or_file> <langs> [--login=<login>] [--password=<password>] [--delay=<seconds>] [--batch] [--bbcode] [--cache=<dir>] [--workers=<count>] [--metrics=<filename>] [--record=<filename>|--replay=<filename> [--replay-latency=<factor>]]
+  campbot contribs [--out=<filename>] [--starts=<start_date>] [--ends=<end_date>] [--delay=<seconds>] [--cache=<dir>] [--metrics=<filename>] [--record=<filename>|--replay=<filename> [--replay-latency=<factor>]]
+  campbot export <url> [--out=<filename>] [--delay=<seconds>] [--cache=<dir>] [--workers=<count>] [--metrics=<filename>] [--record=<filename>|--replay=<filename> [--replay-latency=<factor>]]
   campbot check_voters <url> [--login=<login>] [--password=<password>]
 
 
@@ -14,13 +15,25 @@ Options:
   --password=<password>     Bot password
   --batch                   Batch mode, means that no confirmation is required before saving
                             Use very carefully!
-  --delay=<seconds>         Minimum delay between each request. Default : 3 seconds
+  --delay=<seconds>         Average delay between each request. Default : 3 seconds
+                            After an idle period, up to 5 requests can be sent at once
   --bbcode                  Clean old BBCode in markdown
   --out=<filename>          Output file name. Default value will depend on process
+  --cache=<dir>             Directory where responses are kept between runs
+  --workers=<count>         Number of documents fetched simultaneously. Default : 1
+  --metrics=<filename>      Requests metrics file, in Prometheus text format. Written after each poll
+                            by watch command
+  --record=<filename>       Record all requests and responses in a cassette file
+  --replay=<filename>       Answer requests from a cassette file, instead of camptocamp.org
+  --replay-latency=<factor> On replay, wait for recorded latencies multiplied by this factor.
+                            Default : instant answers
+  --interval=<seconds>      Delay between two polls of recent changes. Default : 300 seconds
+  --cursor=<filename>       File where last seen contribution is kept between runs
 
 
 Commands:
   check_rc      Check (and clean) recent changes.
+  watch         Check (and clean) recent changes as soon as they are made.
   clean         Clean documents.
                 <url_or_file> is like https://www.camptocamp.org/routes#a=523281, or, simplier, routes#a=523281. 
                 filename is also accepted, and must be like : 
@@ -54,7 +67,9 @@ def get_campbot(args):
     if "CAMPBOT_CREDENTIALS" in os.environ and not args["--login"]:
         args["--login"], args["--password"] = os.environ["CAMPBOT_CREDENTIALS"].split("@", 1)
 
-    bot = CampBot(proxies=proxies, min_delay=args["--delay"])
+    bot = CampBot(proxies=proxies, min_delay=args["--delay"], cache_dir=args["--cache"], workers=args["--workers"],
+                  record=args["--record"], replay=args["--replay"],
+                  replay_latency=float(args["--replay-latency"]) if args["--replay-latency"] else None)
 
     if args["--login"] and args["--password"]:
         bot.login(login=args["--login"], password=args["--password"])
@@ -67,27 +82,51 @@ def main_entry_point():
 
 
 def main(args):
+    bot = get_campbot(args)
+
+    try:
+        run_command(bot, args)
+    finally:
+        # also on interruption, as watch command runs until it's stopped
+        logging.info("Requests summary :\n%s", bot.metrics.get_summary())
+
+        if args["--metrics"]:
+            bot.metrics.write_prometheus(args["--metrics"])
+
+        bot.close()
+
+
+def run_command(bot, args):
     if args["check_rc"]:
         from campbot.checkers import check_recent_changes
 
-        check_recent_changes(get_campbot(args),
+        check_recent_changes(bot,
                              days=int(args["<days>"]),
                              ask_before_saving=not args["--batch"])
 
+    elif args["watch"]:
+        from campbot.checkers import watch_recent_changes
+
+        watch_recent_changes(bot,
+                             interval=float(args["--interval"] or 300),
+                             ask_before_saving=not args["--batch"],
+                             cursor_filename=args["--cursor"],
+                             metrics_filename=args["--metrics"])
+
     elif args["clean"]:
-        get_campbot(args).clean(args["<url_or_file>"],
-                                langs=args["<langs>"].split(","),
-                                ask_before_saving=not args["--batch"],
-                                clean_bbcode=args["--bbcode"])
+        bot.clean(args["<url_or_file>"],
+                  langs=args["<langs>"].split(","),
+                  ask_before_saving=not args["--batch"],
+                  clean_bbcode=args["--bbcode"])
 
     elif args["contribs"]:
-        get_campbot(args).export_contributions(starts=args["--starts"], ends=args["--ends"], filename=args["--out"])
+        bot.export_contributions(starts=args["--starts"], ends=args["--ends"], filename=args["--out"])
 
     elif args["export"]:
-        get_campbot(args).export(args["<url>"], args["--out"])
+        bot.export(args["<url>"], args["--out"])
 
     elif args["check_voters"]:
-        get_campbot(args).check_voters(args["<url>"])
+        bot.check_voters(args["<url>"])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,379 @@
+# coding: utf-8
+
+"""
+Asyncio counterparts of :doc:`WikiBot </API/WikiBot>` and :doc:`ForumBot </API/ForumBot>`. Requires
+python 3.6 and aiohttp (``pip install campbot[async]``).
+
+Methods returns the same objects, and use the same rate limiting than synchronous bots :
+
+.. code-block:: python
+
+    from campbot.aio import AsyncCampBot
+
+    async def main():
+        async with AsyncCampBot(use_demo=True) as bot:
+            route = await bot.wiki.get_route(123)
+
+            async for contrib in bot.wiki.get_contributions(oldest_date="2018-05-12"):
+                print(contrib.document.title)
+
+Objects methods that send requests (``save()``, ``is_newbie()``...) are synchronous, they are
+not available on objects returned by asynchronous bots.
+"""
+
+import asyncio
+import logging
+
+import aiohttp
+
+from . import objects, utils
+from .core import BaseBot, WikiBot, _get_contributions_dates, _get_documents_url, _get_post_ids
+from .throttling import AdaptiveRateLimiter, RetryPolicy, monotonic, parse_retry_after
+
+__all__ = ['AsyncCampBot', 'AsyncWikiBot', 'AsyncForumBot', 'AsyncBaseBot']
+
+
+class AsyncBaseBot(object):
+    min_delay = BaseBot.min_delay
+    burst = BaseBot.burst
+    max_throttled_retries = BaseBot.max_throttled_retries
+    timeout = BaseBot.timeout
+
+    retry_on = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError)
+
+    def __init__(self, campbot, api_url, proxies=None, min_delay=None, rate_limiter=None, retry_policy=None):
+        self.campbot = campbot
+        self.api_url = api_url
+        self.proxies = proxies or {}
+        self.headers = {}
+        self._session = None
+
+        min_delay = self.min_delay.total_seconds() if min_delay is None else float(min_delay)
+
+        if rate_limiter is None:
+            rate_limiter = AdaptiveRateLimiter(rate=1 / min_delay if min_delay > 0 else float("inf"),
+                                               burst=self.burst)
+
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+
+    @property
+    def effective_rate(self):
+        """Current request rate allowed by the rate limiter, in requests per second"""
+        return self.rate_limiter.rate
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _wait(self):
+        delay = self.rate_limiter.reserve()
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return delay
+
+    async def get(self, url, **kwargs):
+        params = {key: str(value) for key, value in kwargs.items()}
+        content_type, content = await self._retry(self._request, "GET", url, params=params)
+
+        if content_type.startswith('application/json'):
+            return utils.json_loads(content)
+        else:
+            return content
+
+    async def post(self, url, data):
+        content_type, content = await self._request("POST", url, json=data)
+
+        assert content_type.startswith('application/json')
+
+        return utils.json_loads(content)
+
+    async def put(self, url, data):
+        content_type, content = await self._request("PUT", url, json=data)
+
+        assert content_type.startswith('application/json')
+
+        return utils.json_loads(content)
+
+    def _is_transient(self, error):
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.retry_policy.retry_statuses
+
+        return isinstance(error, self.retry_on)
+
+    async def _retry(self, func, *args, **kwargs):
+        policy = self.retry_policy
+        start = policy.now()
+        attempt = 0
+
+        while True:
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = policy.next_delay(attempt, start, e, transient=self._is_transient(e))
+
+                if delay is None:
+                    raise
+
+                await asyncio.sleep(delay)
+
+    async def _request(self, method, url, **kwargs):
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+
+        for attempt in range(self.max_throttled_retries + 1):
+            await self._wait()
+            logging.debug("%s %s", method, url)
+
+            start = monotonic()
+            async with self._session.request(method, self.api_url + url,
+                                             headers=self.headers,
+                                             proxy=self.proxies.get("https"),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                             **kwargs) as res:
+                content = await res.read()
+            latency = monotonic() - start
+
+            retry_after = parse_retry_after(res.headers.get("Retry-After"))
+
+            if not self.rate_limiter.on_response(res.status, latency, retry_after):
+                break
+
+            logging.warning("%s %s throttled with status %s, rate is now %.3f requests/s",
+                            method, url, res.status, self.effective_rate)
+
+        res.raise_for_status()
+
+        return res.headers.get("Content-Type", ""), content
+
+
+class AsyncWikiBot(AsyncBaseBot):
+    """
+        Asynchronous get functions for camptocamp.org wiki
+    """
+
+    page_size = WikiBot.page_size
+
+    @property
+    def ui_url(self):
+        return self.api_url.replace("api", "www")
+
+    async def get_wiki_object_version(self, item_id, document_type, lang, version_id):
+        if not version_id:
+            return None
+
+        constructor = objects.get_constructor(document_type)
+
+        url = "/{}/{}/{}/{}"
+        data = await self.get(url.format(constructor.url_path, item_id, lang, version_id))
+
+        return objects.Version(self.campbot, data)
+
+    async def get_wiki_object(self, item_id, document_type=None, constructor=None):
+        """
+        Return a wiki object. You must specify document_type OR constructor
+
+        :param item_id: numerical document id
+        :param document_type: type letter ('r' for route, 'w' for waypoint...)
+        :param constructor: objects.Route, objects.Waypoint...
+
+        :return: a wiki object
+        """
+
+        if not constructor:
+            constructor = objects.get_constructor(document_type)
+
+        return constructor(self.campbot, await self.get("/{}/{}".format(constructor.url_path, item_id)))
+
+    async def get_article(self, article_id):
+        return await self.get_wiki_object(article_id, constructor=objects.Article)
+
+    async def get_route(self, route_id):
+        return await self.get_wiki_object(route_id, constructor=objects.Route)
+
+    async def get_waypoint(self, waypoint_id):
+        return await self.get_wiki_object(waypoint_id, constructor=objects.Waypoint)
+
+    async def get_profile(self, profile_id):
+        return await self.get_wiki_object(profile_id, constructor=objects.WikiUser)
+
+    async def get_area(self, area_id):
+        return await self.get_wiki_object(area_id, constructor=objects.Area)
+
+    async def get_image(self, image_id):
+        return await self.get_wiki_object(image_id, constructor=objects.Image)
+
+    async def get_book(self, book_id):
+        return await self.get_wiki_object(book_id, constructor=objects.Book)
+
+    async def get_map(self, map_id):
+        return await self.get_wiki_object(map_id, constructor=objects.Map)
+
+    async def get_xreport(self, xreport_id):
+        return await self.get_wiki_object(xreport_id, constructor=objects.Xreport)
+
+    async def get_documents(self, filters=None, document_type=None, constructor=None):
+        """
+        Asynchronous generator of wiki objects
+
+        :param filters: a key-value dictionary
+        :param document_type: type letter, like 'a', 'r', 'w'...
+        :param constructor: objects.Area, objects.Route ...
+        """
+
+        if not constructor:
+            constructor = objects.get_constructor(document_type=document_type)
+
+        async for doc in self.get_documents_raw(constructor.url_path, filters):
+            yield await self.get_wiki_object(doc["document_id"], constructor=constructor)
+
+    async def get_documents_raw(self, url_path, filters=None):
+        filters = dict(filters or {})
+        limit = int(filters.pop("limit", self.page_size))
+        offset = 0
+
+        while True:
+            data = await self.get(_get_documents_url(url_path, dict(filters, offset=offset, limit=limit)))
+
+            for doc in data["documents"]:
+                yield doc
+
+            offset += len(data["documents"])
+
+            if len(data["documents"]) < limit or offset >= data.get("total", float("inf")):
+                return
+
+    async def get_user(self, user_id=None, wiki_name=None, forum_name=None):
+        if user_id:
+            return objects.WikiUser(self.campbot, await self.get("/profiles/{}".format(user_id)))
+
+        name = wiki_name or forum_name
+
+        data = await self.get("/search?q={}&t=u&limit=50".format(name))
+
+        prop = "name" if wiki_name else "forum_username"
+
+        for item in data["users"]["documents"]:
+            if item[prop] == name:
+                return await self.get_user(user_id=item["document_id"])
+
+        raise Exception("Can't find user {}".format(wiki_name or forum_name))
+
+    async def get_contributions(self, oldest_date=None, newest_date=None, user_id=None):
+        """
+        Asynchronous generator of contributions, newest first
+        """
+
+        oldest_date, newest_date = _get_contributions_dates(oldest_date, newest_date)
+
+        user_filter = "&u={}".format(user_id) if user_id else ""
+
+        d = await self.get("/documents/changes?limit=50" + user_filter)
+
+        while True:
+            for item in d["feed"]:
+                written_at = utils.parse_datetime(item["written_at"])
+
+                if written_at < oldest_date:
+                    return
+
+                if newest_date > written_at:
+                    yield objects.Contribution(self.campbot, item)
+
+            if "pagination_token" not in d:
+                break
+
+            d = await self.get("/documents/changes?limit=50&token=" + d["pagination_token"] + user_filter)
+
+
+class AsyncForumBot(AsyncBaseBot):
+    async def post_message(self, message, url):
+        topic_id, _ = _get_post_ids(self.api_url, url)
+        await self.post("/posts", {"topic_id": topic_id, "raw": message})
+
+    async def get_group_members(self, group_name):
+        result = []
+
+        expected_len = 1
+        while len(result) < expected_len:
+            data = await self.get("/groups/{}/members.json?limit=50&offset={}".format(group_name, len(result)))
+            expected_len = data["meta"]["total"]
+            result += data["members"]
+
+        return [objects.ForumUser(self.campbot, user) for user in result]
+
+    async def get_topic(self, topic_id=None, url=None):
+        if url:
+            topic_id, _ = _get_post_ids(self.api_url, url)
+
+        return await self.get("/t/{}.json".format(topic_id))
+
+    async def get_post(self, topic_id=None, post_number=None, url=None):
+        if url:
+            topic_id, post_number = _get_post_ids(self.api_url, url)
+
+        topic = await self.get_topic(topic_id)
+        post_id = topic["post_stream"]["stream"][post_number - 1]
+
+        return objects.Post(self.campbot, await self.get("/posts/{}.json".format(post_id)))
+
+    async def get_participants(self, url):
+        topic = await self.get_topic(url=url)
+        return topic["details"]["participants"]
+
+
+class AsyncCampBot(object):
+    """
+    Asynchronous CampBot. Must be closed, or used as an asynchronous context manager.
+    """
+
+    def __init__(self, min_delay=None, proxies=None, use_demo=False, rate_limiter=None, retry_policy=None,
+                 wiki_url=None, forum_url=None):
+        """
+            :param min_delay: in seconds, average delay between each request
+            :param proxies: key-url dictionary
+            :param use_demo: Boolean, True if you want to use C2C demo API
+            :param rate_limiter: throttling.TokenBucket shared by wiki and forum
+            :param retry_policy: throttling.RetryPolicy used for GET requests
+            :param wiki_url: wiki API URL, overrides use_demo
+            :param forum_url: forum URL, overrides use_demo
+        """
+
+        domain = "camptocamp" if not use_demo else "demov6.camptocamp"
+
+        self.wiki = AsyncWikiBot(self, wiki_url or "https://api.{}.org".format(domain),
+                                 proxies=proxies, min_delay=min_delay,
+                                 rate_limiter=rate_limiter, retry_policy=retry_policy)
+
+        self.forum = AsyncForumBot(self, forum_url or "https://forum.{}.org".format(domain),
+                                   proxies=proxies, min_delay=min_delay,
+                                   rate_limiter=rate_limiter, retry_policy=retry_policy)
+
+        self.moderator = False
+
+        self.forum.headers['X-Requested-With'] = "XMLHttpRequest"
+
+        if not forum_url:
+            self.forum.headers['Host'] = "forum.{}.org".format(domain)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        await self.wiki.close()
+        await self.forum.close()
+
+    async def login(self, login, password):
+        res = await self.wiki.post("/users/login", {"username": login, "password": password, "discourse": True})
+        token = res["token"]
+        self.moderator = "moderator" in res["roles"]
+        self.wiki.headers["Authorization"] = 'JWT token="{}"'.format(token)
+        await self.forum.get(res["redirect_internal"].replace(self.forum.api_url, ""))
+        self.forum.headers['X-CSRF-Token'] = (await self.forum.get("/session/csrf"))["csrf"]
@@ -0,0 +1,493 @@
+# coding: utf-8
+
+"""
+Local persistent stores, used to avoid requests to camptocamp.org
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+__all__ = ['ResponseCache', 'VersionStore', 'UserStatusStore', 'CheckResultStore', 'LruCache', 'ContributionCursor']
+
+
+def _compress(content):
+    return sqlite3.Binary(zlib.compress(content))
+
+
+def _decompress(blob):
+    return zlib.decompress(bytes(blob))
+
+
+class _SqliteStore(object):
+    """
+    Base class for stores : one SQLite file, usable from several threads
+    """
+
+    _schema = ()
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+
+        for sql in self._schema:
+            self._conn.execute(sql)
+
+        self._conn.commit()
+
+    def _execute(self, sql, parameters=()):
+        with self._lock:
+            cur = self._conn.execute(sql, parameters)
+            result = cur.fetchall()
+            self._conn.commit()
+            cur.close()
+
+        return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedResponse(object):
+    def __init__(self, url, key, ttl, content_type, content, etag=None, last_modified=None, stored_at=0):
+        self.url = url
+        self.key = key
+        self.ttl = ttl
+        self.content_type = content_type
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) - self.stored_at < self.ttl
+
+    def get_conditional_headers(self):
+        """
+        :return: headers for a conditional request
+        """
+
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        return headers
+
+
+class ResponseCache(_SqliteStore):
+    """
+    On-disk cache of GET responses, compressed, keyed on URL and parameters.
+
+    Cache behaviour is given by ``rules``, a list of (regular expression, TTL). First
+    rule whose regular expression matches the URL (without host) gives the TTL :
+
+    * ``None`` : never cached
+    * ``0`` : always revalidated with a conditional request (ETag/Last-Modified)
+    * number of seconds : used without any request during this delay, then revalidated
+    """
+
+    default_rules = (
+        (r"^/documents/changes", None),
+        (r"^/search", None),
+        (r"^/users/", None),
+        (r"^/(session|sso)", None),
+        (r"^/\w+/\d+/\w+/\d+$", None),  # versions, see VersionStore
+        (r"", 0),
+    )
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS response ("
+        " key CHAR(40) PRIMARY KEY,"
+        " url TEXT,"
+        " content_type TEXT,"
+        " etag TEXT,"
+        " last_modified TEXT,"
+        " stored_at REAL,"
+        " content BLOB"
+        ") WITHOUT ROWID;",
+
+        "CREATE INDEX IF NOT EXISTS IX_response_url ON response(url);",
+    )
+
+    def __init__(self, filename, rules=None):
+        """
+        :param filename: SQLite file name
+        :param rules: list of (regular expression, TTL). Default : ResponseCache.default_rules
+        """
+
+        super(ResponseCache, self).__init__(filename)
+
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in (rules or self.default_rules)]
+        self.stats = {"fresh": 0, "revalidated": 0, "downloaded": 0}
+
+    def get_ttl(self, url):
+        for regex, ttl in self.rules:
+            if regex.search(url):
+                return ttl
+
+        return None
+
+    @staticmethod
+    def get_key(url, params):
+        params = json.dumps(params or {}, sort_keys=True)
+        return hashlib.sha1((url + "\n" + params).encode("utf-8")).hexdigest()
+
+    def lookup(self, url, params=None):
+        """
+        :return: a CachedResponse, or None if URL is not cached
+        """
+
+        ttl = self.get_ttl(url)
+
+        if ttl is None:
+            return None
+
+        key = self.get_key(url, params)
+
+        rows = self._execute("SELECT content_type, etag, last_modified, stored_at, content "
+                             "FROM response WHERE key=?", (key,))
+
+        if len(rows) == 0:
+            return None
+
+        content_type, etag, last_modified, stored_at, content = rows[0]
+
+        result = CachedResponse(url, key, ttl, content_type, _decompress(content),
+                                etag=etag, last_modified=last_modified, stored_at=stored_at)
+
+        if result.is_fresh():
+            self.stats["fresh"] += 1
+
+        return result
+
+    def store(self, url, params, response):
+        """
+        Store a response, if its URL is cacheable
+        """
+
+        ttl = self.get_ttl(url)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if ttl is None or response.status_code != 200:
+            return
+
+        if ttl == 0 and not etag and not last_modified:  # can't be revalidated
+            return
+
+        self.stats["downloaded"] += 1
+        self._execute("INSERT OR REPLACE INTO response"
+                      "(key, url, content_type, etag, last_modified, stored_at, content)"
+                      "VALUES (?,?,?,?,?,?,?)",
+                      (self.get_key(url, params), url, response.headers.get("Content-type", ""),
+                       etag, last_modified, time.time(), _compress(response.content)))
+
+    def refresh(self, cached_response):
+        """
+        Mark a cached response as fresh, after a successful revalidation (304)
+        """
+
+        self.stats["revalidated"] += 1
+        cached_response.stored_at = time.time()
+        self._execute("UPDATE response SET stored_at=? WHERE key=?", (cached_response.stored_at,
+                                                                       cached_response.key))
+
+    def invalidate(self, url):
+        """
+        Forget all responses for an URL, whatever are parameters
+        """
+
+        self._execute("DELETE FROM response WHERE url=?", (url,))
+
+
+class VersionStore(_SqliteStore):
+    """
+    Permanent store of document versions. A version never changes : once fetched, it's served locally.
+
+    Payloads are compressed, and stored once per content hash.
+    """
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS content ("
+        " hash CHAR(40) PRIMARY KEY,"
+        " data BLOB"
+        ") WITHOUT ROWID;",
+
+        "CREATE TABLE IF NOT EXISTS version ("
+        " document_id INTEGER,"
+        " lang CHAR(2),"
+        " version_id INTEGER,"
+        " hash CHAR(40),"
+        " PRIMARY KEY (document_id, lang, version_id)"
+        ") WITHOUT ROWID;",
+    )
+
+    def __init__(self, filename):
+        super(VersionStore, self).__init__(filename)
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, document_id, lang, version_id):
+        """
+        :return: raw version data, or None if version is not stored
+        """
+
+        rows = self._execute("SELECT content.data FROM version "
+                             "JOIN content ON content.hash=version.hash "
+                             "WHERE document_id=? AND lang=? AND version_id=?",
+                             (document_id, lang, version_id))
+
+        if len(rows) == 0:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return json.loads(_decompress(rows[0][0]).decode("utf-8"))
+
+    def put(self, document_id, lang, version_id, data):
+        content = json.dumps(data, sort_keys=True).encode("utf-8")
+        digest = hashlib.sha1(content).hexdigest()
+
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO content(hash, data) VALUES (?,?)",
+                               (digest, _compress(content)))
+            self._conn.execute("INSERT OR REPLACE INTO version(document_id, lang, version_id, hash) "
+                               "VALUES (?,?,?,?)",
+                               (document_id, lang, version_id, digest))
+            self._conn.commit()
+
+
+class UserStatusStore(_SqliteStore):
+    """
+    Store of users newbie status. A user who is not a newbie will never be one again,
+    so this status is kept forever. Newbie status is kept during ``ttl`` seconds.
+
+    With ``:memory:`` as file name, status are kept only during current run.
+    """
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS user_status ("
+        " user_id INTEGER PRIMARY KEY,"
+        " newbie INTEGER,"
+        " checked_at REAL"
+        ");",
+    )
+
+    def __init__(self, filename, ttl=24 * 3600):
+        super(UserStatusStore, self).__init__(filename)
+        self.ttl = ttl
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, user_id):
+        """
+        :return: True if user is a newbie, False if not, None if status is unknown or expired
+        """
+
+        rows = self._execute("SELECT newbie, checked_at FROM user_status WHERE user_id=?", (user_id,))
+
+        if len(rows) == 0 or (rows[0][0] and time.time() - rows[0][1] >= self.ttl):
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return bool(rows[0][0])
+
+    def put(self, user_id, newbie):
+        self._execute("INSERT OR REPLACE INTO user_status(user_id, newbie, checked_at) VALUES (?,?,?)",
+                      (user_id, int(newbie), time.time()))
+
+
+class CheckResultStore(_SqliteStore):
+    """
+    Permanent store of checker tests results. A result is given by a contribution (a version, and its previous
+    one), and by test configuration : it's keyed by version id, lang and test cache key, which must change
+    with test configuration.
+    """
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS check_result ("
+        " version_id INTEGER,"
+        " lang CHAR(2),"
+        " test CHAR(40),"
+        " old_is_ok INTEGER,"
+        " new_is_ok INTEGER,"
+        " PRIMARY KEY (version_id, lang, test)"
+        ") WITHOUT ROWID;",
+    )
+
+    def __init__(self, filename):
+        super(CheckResultStore, self).__init__(filename)
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def get_key(test_key):
+        return hashlib.sha1(test_key.encode("utf-8")).hexdigest()
+
+    def get(self, version_id, lang, test_key):
+        """
+        :return: (old_is_ok, new_is_ok), or None if result is not stored
+        """
+
+        rows = self._execute("SELECT old_is_ok, new_is_ok FROM check_result "
+                             "WHERE version_id=? AND lang=? AND test=?",
+                             (version_id, lang, self.get_key(test_key)))
+
+        if len(rows) == 0:
+            self.stats["misses"] += 1
+            return None
+
+        self.stats["hits"] += 1
+        return bool(rows[0][0]), bool(rows[0][1])
+
+    def put(self, version_id, lang, test_key, result):
+        old_is_ok, new_is_ok = result
+
+        self._execute("INSERT OR REPLACE INTO check_result(version_id, lang, test, old_is_ok, new_is_ok) "
+                      "VALUES (?,?,?,?,?)",
+                      (version_id, lang, self.get_key(test_key), int(bool(old_is_ok)), int(bool(new_is_ok))))
+
+
+class LruCache(object):
+    """
+    In-process least recently used cache, bounded by a number of entries, and by an approximate size in bytes.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """
+        :return: value, or None if key is not cached
+        """
+
+        with self._lock:
+            if key not in self._items:
+                self.stats["misses"] += 1
+                return None
+
+            self.stats["hits"] += 1
+            size, value = self._items.pop(key)
+            self._items[key] = size, value  # most recently used is last
+
+            return value
+
+    def peek(self, key):
+        """
+        :return: value, or None, without updating usage or stats
+        """
+
+        with self._lock:
+            item = self._items.get(key)
+
+        return item[1] if item else None
+
+    def put(self, key, value, size):
+        with self._lock:
+            self._pop(key)
+
+            if size > self.max_bytes:
+                return
+
+            self._items[key] = size, value
+            self.size += size
+
+            while len(self._items) > self.max_entries or self.size > self.max_bytes:
+                self._pop(next(iter(self._items)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        if key in self._items:
+            size, _ = self._items.pop(key)
+            self.size -= size
+
+
+class ContributionCursor(object):
+    """
+    Position in contributions feed, persisted in a JSON file, used to resume an interrupted walk
+    of WikiBot.get_contributions, or to get only contributions newer than a previous walk.
+
+    A contribution is marked as consumed when the next one is asked, so, on resume, the last
+    returned contribution may be returned again.
+    """
+
+    _fields = ("token", "last_version_id", "last_written_at", "newest_version_id", "done")
+
+    def __init__(self, filename=None, autosave=True):
+        """
+        :param filename: JSON file name, or None for an in memory cursor
+        :param autosave: save the cursor after each page, and when iteration stops. Otherwise,
+            save() must be called by caller, typically after committing its own work.
+        """
+
+        self.filename = filename
+        self.autosave = autosave
+
+        self.token = None
+        """Pagination token of the page being walked, None for the first page"""
+
+        self.last_version_id = None
+        """Last consumed contribution"""
+
+        self.last_written_at = None
+        self.newest_version_id = None
+        """Newest contribution seen, start point of next forward walk"""
+
+        self.done = False
+        """True once the backward walk has reached its oldest date"""
+
+        if filename and os.path.exists(filename):
+            with io.open(filename, encoding="utf-8") as f:
+                data = json.load(f)
+
+            for field in self._fields:
+                setattr(self, field, data.get(field))
+
+    def save(self):
+        if not self.filename:
+            return
+
+        data = json.dumps({field: getattr(self, field) for field in self._fields}, sort_keys=True)
+        temp_filename = self.filename + ".tmp"
+
+        with open(temp_filename, "wb") as f:
+            f.write(data.encode("utf-8"))  # on py2, json.dumps returns str
+
+        if os.path.exists(self.filename) and not hasattr(os, "replace"):  # py2
+            os.remove(self.filename)
+
+        getattr(os, "replace", os.rename)(temp_filename, self.filename)
+
+    def checkpoint(self):
+        """
+        Called by the walk at page boundaries, and when it stops : cursor is saved if autosave is set
+        """
+
+        if self.autosave:
+            self.save()
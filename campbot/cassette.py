@@ -0,0 +1,251 @@
+# coding: utf-8
+
+"""
+Record and replay of HTTP exchanges, used to run a scenario offline, for benchmarks and profiling.
+
+A cassette is a gzipped file, with one JSON record per request. Both classes are requests
+transport adapters :
+
+.. code-block:: python
+
+    from campbot import CampBot
+
+    # first run, against camptocamp.org
+    bot = CampBot(record="check_rc.jsonl.gz")
+    ...
+    bot.close()
+
+    # next runs, without any network access
+    bot = CampBot(replay="check_rc.jsonl.gz")
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import base64
+import gzip
+import json
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .throttling import monotonic
+
+__all__ = ['RecordingAdapter', 'ReplayAdapter', 'CassetteMiss']
+
+
+class CassetteMiss(Exception):
+    """Raised on replay, when a request is not in the cassette"""
+
+
+_secret_fields = ("password", "token", "csrf")
+_secret_url_fields = ("redirect_internal",)  # SSO URL, with nonce and signature in query string
+_secret_headers = ("set-cookie",)
+_redacted = "redacted"
+
+
+def _redact_url(url):
+    """
+    :return: URL without its query string if it's a SSO URL
+    """
+
+    return url.split("?")[0] if "/session/sso_login?" in url else url
+
+
+def _redact(text):
+    """
+    :return: text, with values of secret fields (password, JWT token...) replaced, if it's a JSON object
+    """
+
+    if not any('"{}"'.format(field) in text for field in _secret_fields + _secret_url_fields):
+        return text
+
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return text
+
+    if not isinstance(data, dict):
+        return text
+
+    def redact(key, value):
+        if key in _secret_fields:
+            return _redacted
+
+        if key in _secret_url_fields and value:
+            return _redact_url(value)
+
+        return value
+
+    return json.dumps({key: redact(key, value) for key, value in data.items()}, sort_keys=True)
+
+
+def _get_body(request):
+    """
+    :return: request body, redacted. Same redaction is used on record and on replay, so that bodies match.
+    """
+
+    body = request.body
+
+    if body is None:
+        return None
+
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", "replace")
+
+    return _redact(body)
+
+
+def _encode_content(content):
+    try:
+        return {"text": _redact(content.decode("utf-8"))}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode_content(record):
+    if "text" in record:
+        return record["text"].encode("utf-8")
+
+    return base64.b64decode(record["base64"])
+
+
+def load_cassette(filename):
+    """
+    :return: list of records. A truncated cassette (interrupted run) is read up to its last complete record.
+    """
+
+    result = []
+
+    with gzip.open(filename, "rb") as f:
+        try:
+            for line in f:
+                if line.strip():
+                    result.append(json.loads(line.decode("utf-8")))
+        except (EOFError, IOError, ValueError):
+            pass
+
+    return result
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    Send requests with an actual adapter, and append each exchange to a cassette.
+
+    Secrets are not recorded : passwords, tokens and CSRF tokens in JSON bodies, and cookies,
+    are replaced by "redacted". SSO URLs are recorded without their query string (nonce and signature).
+    """
+
+    def __init__(self, filename, adapter=None):
+        """
+        :param filename: cassette file name, overwritten
+        :param adapter: adapter used to send requests. Default : requests HTTPAdapter
+        """
+
+        super(RecordingAdapter, self).__init__()
+
+        self.filename = filename
+        self.adapter = adapter or HTTPAdapter()
+        self._lock = threading.Lock()
+        self._file = gzip.open(filename, "wb")
+
+    def send(self, request, **kwargs):
+        start = monotonic()
+        response = self.adapter.send(request, **kwargs)
+        content = response.content
+        latency = monotonic() - start
+
+        record = {
+            "method": request.method,
+            "url": _redact_url(request.url),
+            "body": _get_body(request),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": {key: _redacted if key.lower() in _secret_headers else value
+                        for key, value in response.headers.items()},
+            "latency": latency,
+        }
+        record.update(_encode_content(content))
+
+        line = json.dumps(record, sort_keys=True) + "\n"
+
+        with self._lock:
+            self._file.write(line.encode("utf-8"))
+            self._file.flush()  # cassette stays readable if the run is interrupted
+
+        return response
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Answer requests from a cassette, without any network access.
+
+    Requests are matched on method, URL and body. When the same request has been
+    recorded several times, responses are replayed in recorded order, and the last
+    one is repeated.
+    """
+
+    def __init__(self, filename, latency_factor=None, sleep=time.sleep):
+        """
+        :param filename: cassette file name
+        :param latency_factor: None for instant answers, 1.0 to wait for recorded latencies,
+            0.5 to wait half of them...
+        """
+
+        super(ReplayAdapter, self).__init__()
+
+        self.filename = filename
+        self.latency_factor = latency_factor
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._records = {}
+
+        for record in load_cassette(filename):
+            key = (record["method"], record["url"], record["body"])
+            self._records.setdefault(key, deque()).append(record)
+
+    def __len__(self):
+        return sum(len(records) for records in self._records.values())
+
+    def _pop(self, request):
+        key = (request.method, _redact_url(request.url), _get_body(request))
+
+        with self._lock:
+            records = self._records.get(key)
+
+            if not records:
+                raise CassetteMiss("{} {} is not in {}".format(request.method, request.url, self.filename))
+
+            return records.popleft() if len(records) > 1 else records[0]
+
+    def send(self, request, **kwargs):
+        record = self._pop(request)
+
+        if self.latency_factor:
+            self._sleep(record["latency"] * self.latency_factor)
+
+        response = requests.Response()
+        response.status_code = record["status"]
+        response.reason = record["reason"]
+        response.headers = CaseInsensitiveDict(record["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response._content = _decode_content(record)
+
+        return response
+
+    def close(self):
+        pass
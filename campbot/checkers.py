@@ -2,9 +2,12 @@
 
 from __future__ import unicode_literals, print_function, division
 
-from dateutil import parser
 import datetime
+import logging
+import time
 from campbot import utils
+from campbot.cache import ContributionCursor
+from campbot.processors import get_automatic_replacments
 
 
 def _format_delta(delta):
@@ -30,25 +33,99 @@ def _get_diff_url(bot, document, lang, previous_version_id, version_id):
         version_id)
 
 
+def get_changed_fields(old_version, new_version):
+    """
+    Fields modified between two versions of a document. Locale fields are like locales.description,
+    and locales if a locale is added or removed.
+
+    :return: set of field names, or None if a version is missing, or if document is a redirection
+    """
+
+    if not old_version or not new_version:
+        return None
+
+    old_doc, new_doc = old_version.document, new_version.document
+
+    if "redirects_to" in old_doc or "redirects_to" in new_doc:
+        return None
+
+    result = {key for key in set(old_doc) | set(new_doc)
+              if key not in ("locales", "version") and old_doc.get(key) != new_doc.get(key)}
+
+    old_locales = {locale["lang"]: locale for locale in old_doc.get("locales") or []}
+    new_locales = {locale["lang"]: locale for locale in new_doc.get("locales") or []}
+
+    if set(old_locales) != set(new_locales):
+        result.add("locales")
+
+    for lang in set(old_locales) & set(new_locales):
+        old_locale, new_locale = old_locales[lang], new_locales[lang]
+        result.update("locales." + key for key in set(old_locale) | set(new_locale)
+                      if key != "version" and old_locale.get(key) != new_locale.get(key))
+
+    return result
+
+
+def _depends_on(test, changes):
+    """
+    :param changes: get_changed_fields result
+    :return: False if test result can't change, because its ``depends_on`` fields are not modified.
+        Tests without ``depends_on`` are always evaluated.
+    """
+
+    depends_on = getattr(test, "depends_on", None)
+
+    if changes is None or depends_on is None:
+        return True
+
+    return any(change == field or change.startswith(field + ".") or field.startswith(change + ".")
+               for change in changes for field in depends_on)
+
+
 class ContributionReport(object):
-    def __init__(self, bot, contrib, tests):
+    def __init__(self, bot, contrib, tests, versions=None):
+        """
+        :param versions: dict of already fetched versions, by version id. Fetched versions are added to it,
+            so that adjacent contributions of a document share them. Versions must not be modified by tests.
+        """
+
         self.contrib = contrib
         self.need_report = False
 
-        self.new = bot.wiki.get_wiki_object_version(contrib.document.document_id,
-                                                    contrib.document.type,
-                                                    contrib.lang,
-                                                    contrib.version_id)
+        versions = {} if versions is None else versions
 
-        self.old = bot.wiki.get_wiki_object_version(contrib.document.document_id,
-                                                    contrib.document.type,
-                                                    contrib.lang,
-                                                    self.new.previous_version_id)
+        def get_version(version_id):
+            if version_id not in versions:
+                versions[version_id] = bot.wiki.get_wiki_object_version(contrib.document.document_id,
+                                                                        contrib.document.type,
+                                                                        contrib.lang,
+                                                                        version_id)
+
+            return versions[version_id]
+
+        self.new = get_version(contrib.version_id)
+        self.old = get_version(self.new.previous_version_id)
 
         self.emojis = []
 
+        changes = get_changed_fields(self.old, self.new)
+
+        store = bot.check_results
+
         for test in tests:
-            old_is_ok, new_is_ok = test(contrib, self.old, self.new)
+            if not _depends_on(test, changes):
+                continue  # inputs are unchanged, so is the result
+
+            key = getattr(test, "cache_key", None) if store is not None else None
+            result = store.get(contrib.version_id, contrib.lang, key) if key else None
+
+            if result is None:
+                result = test(contrib, self.old, self.new)
+
+                if key:
+                    store.put(contrib.version_id, contrib.lang, key, result)
+
+            old_is_ok, new_is_ok = result
 
             if old_is_ok and not new_is_ok:
                 self.emojis.append(test.fail_marker)
@@ -67,7 +144,7 @@ class ContributionReport(object):
                   "{emojis} **·** "
                   "[{username}]({user_contrib_url}) →‎ "
                   "*{comment}*").format(
-            timestamp=parser.parse(self.contrib.written_at).strftime("%H:%M"),
+            timestamp=utils.parse_datetime(self.contrib.written_at).strftime("%H:%M"),
             emojis="".join(self.emojis),
             diff_title="diff" if self.new.previous_version_id else "**new**",
             diff_url=self.new.get_diff_url(lang),
@@ -90,7 +167,7 @@ class ContributionReport(object):
                   "[{doc_title}]({doc_url}) **·** "
                   "[{username}]({user_contrib_url}) →‎ "
                   "*{comment}*").format(
-            timestamp=parser.parse(self.contrib.written_at).strftime("%H:%M"),
+            timestamp=utils.parse_datetime(self.contrib.written_at).strftime("%H:%M"),
             emojis="".join(self.emojis),
             doc_title=title if len(title) else "*Vide*",
             doc_url=self.new.document.get_url(lang),
@@ -111,8 +188,11 @@ class DocumentReport(object):
         self.need_report = False
         self.sub_reports = []
 
+        # contributions are newest first : old version of a report is new version of the next one
+        versions = {}
+
         for contrib in contributions:
-            report = ContributionReport(bot, contrib, tests)
+            report = ContributionReport(bot, contrib, tests, versions)
             self.sub_reports.append(report)
             self.need_report = self.need_report or report.need_report
 
@@ -137,7 +217,7 @@ class DocumentReport(object):
                 "({delta}) **·** "
                 "[{doc_title}]({doc_url}) → "
                 "*{modifications} modifications*".format(
-                    timestamp=parser.parse(newest_report.contrib.written_at).strftime("%H:%M"),
+                    timestamp=utils.parse_datetime(newest_report.contrib.written_at).strftime("%H:%M"),
                     doc_title=title if len(title) else "*Vide*",
                     doc_url=newest_report.new.document.get_url(lang),
                     hist_url=newest_report.new.document.get_history_url(newest_report.contrib.lang),
@@ -155,8 +235,15 @@ class DocumentReport(object):
         return "\n".join(result)
 
 
+def get_check_message_url(bot):
+    """
+    :return: URL of forum topic holding checks configuration, where reports are posted
+    """
+
+    return bot.forum.api_url + "/t/topoguide-verifications-automatiques/201480"
+
+
 def check_recent_changes(bot, days, ask_before_saving):
-    check_message_url = "https://forum.camptocamp.org/t/topoguide-verifications-automatiques/201480"
     lang = "fr"
 
     newest_date = utils.today().replace(hour=0, minute=0, second=0, microsecond=0)
@@ -164,19 +251,123 @@ def check_recent_changes(bot, days, ask_before_saving):
 
     bot.fix_recent_changes(oldest_date, newest_date, lang, ask_before_saving)
 
-    tests = get_fixed_tests(lang)
-    tests += get_re_tests(bot.forum.get_post(url=check_message_url), lang)
+    tests = get_tests(bot, lang)
 
     items = bot.get_modified_documents(lang=lang, oldest_date=oldest_date, newest_date=newest_date).values()
 
-    reports = []
+    bot.wiki.prefetch_user_status(c.user.user_id for contributions in items for c in contributions)
+
+    reports = build_reports(bot, items, tests)
+
+    messages = get_report_messages(bot, tests, reports, lang)
+
+    for m in messages:
+        print(m)
+
+    if len(messages) != 0:
+        bot.forum.post_message("\n".join(messages), get_check_message_url(bot))
+
+
+def watch_recent_changes(bot, interval, ask_before_saving, cursor_filename=None, polls=None, sleep=time.sleep,
+                         metrics_filename=None):
+    """
+    Follow mode of check_recent_changes : new contributions are polled every interval,
+    fixed, checked, and reported on forum if needed.
+
+    When nothing changed, a poll costs one request. Tests, and bot caches, are kept between polls.
+
+    :param interval: seconds between two polls
+    :param cursor_filename: JSON file where last seen contribution is kept. When it exists, contributions
+        made while the watcher was stopped are processed.
+    :param polls: number of polls, default is infinite
+    :param metrics_filename: requests metrics file, in Prometheus text format, written after each poll
+
+    A failed poll is logged, and its contributions are processed again by next poll.
+    """
+
+    lang = "fr"
+
+    cursor = ContributionCursor(cursor_filename, autosave=False)
 
-    for i, contributions in enumerate(items):
-        print("Build report {}/{}".format(i, len(items)))
-        reports.append(DocumentReport(bot, contributions, tests))
+    if cursor.newest_version_id is None:
+        # first run, only contributions made from now are watched
+        feed = bot.wiki.get("/documents/changes?limit=1")["feed"]
+        cursor.newest_version_id = feed[0]["version_id"] if len(feed) else 0
+        cursor.save()
 
+    tests = get_tests(bot, lang)
+    processors = get_automatic_replacments(bot)
+
+    poll = 0
+    while polls is None or poll < polls:
+        if poll != 0:
+            sleep(interval)
+
+        poll += 1
+        newest_version_id = cursor.newest_version_id
+
+        try:
+            _process_new_contributions(bot, cursor, lang, ask_before_saving, tests, processors)
+        except Exception:
+            # contributions of this poll will be processed again by next one
+            logging.exception("Poll of recent changes failed")
+            cursor.newest_version_id = newest_version_id
+        else:
+            # cursor is saved once its contributions are processed
+            cursor.save()
+
+        if metrics_filename:
+            bot.metrics.write_prometheus(metrics_filename)
+
+
+def _process_new_contributions(bot, cursor, lang, ask_before_saving, tests, processors):
+    contributions = list(bot.wiki.get_contributions(oldest_date=datetime.datetime.min,
+                                                    newest_date=datetime.datetime.max,
+                                                    cursor=cursor, forward=True))
+
+    if len(contributions) == 0:
+        return
+
+    logging.info("%s new contributions", len(contributions))
+
+    bot.fix_recent_changes(None, None, lang, ask_before_saving, contributions=contributions,
+                           processors=processors)
+
+    items = bot.get_modified_documents(lang, contributions=contributions).values()
+    bot.wiki.prefetch_user_status(c.user.user_id for c in contributions)
+    reports = build_reports(bot, items, tests)
+
+    if any(report.need_report for report in reports):
+        messages = get_report_messages(bot, tests, reports, lang)
+        bot.forum.post_message("\n".join(messages), get_check_message_url(bot))
+
+
+def build_reports(bot, items, tests):
+    """
+    Build reports with wiki workers. Progress is logged.
+
+    :param items: list of contributions lists, one per document
+    :return: list of DocumentReport, in items order
+    """
+
+    progress = utils.Progress("Build reports", len(items))
+    result = []
+
+    for report in utils.ordered_map(lambda contributions: DocumentReport(bot, contributions, tests),
+                                    items, workers=bot.wiki.workers):
+        result.append(report)
+        progress.update()
+
+    return result
+
+
+def get_tests(bot, lang):
+    return get_fixed_tests(lang) + get_re_tests(bot.forum.get_post(url=get_check_message_url(bot)), lang)
+
+
+def get_report_messages(bot, tests, reports, lang):
     messages = [
-        "[Explications]({})\n".format(check_message_url),
+        "[Explications]({})\n".format(get_check_message_url(bot)),
         "[details=Signification des icônes]\n<table>",
         "<tr><th>Test</th><th>A relire</th><th>Corrigé</th></tr>",
     ]
@@ -191,11 +382,7 @@ def check_recent_changes(bot, days, ask_before_saving):
     messages.append("</table>\n[/details]\n\n----\n\n")
     messages += [report.get_report(bot, lang) for report in reports if report.need_report]
 
-    for m in messages:
-        print(m)
-
-    if len(messages) != 0:
-        bot.forum.post_message("\n".join(messages), check_message_url)
+    return messages
 
 
 def emoji(src, text):
@@ -222,7 +409,15 @@ def get_re_tests(configuration, lang):
             elif parts[0].strip() in ("* Corrigé",):
                 test.success_marker = parts[1].strip()
 
-    return filter(lambda t: len(t.patterns) != 0, result)
+    result = [t for t in result if len(t.patterns) != 0]
+
+    # all patterns are searched at once
+    pattern_set = utils.PatternSet([t.patterns for t in result])
+
+    for i, test in enumerate(result):
+        test.set_pattern_set(pattern_set, i)
+
+    return result
 
 
 def get_fixed_tests(lang):
@@ -238,6 +433,8 @@ class LengthTest(object):
 
         self.fail_marker = emoji("/images/emoji/apple/rage.png?v=3", self.name)
         self.success_marker = ""
+        self.depends_on = ("locales",)
+        self.cache_key = "LengthTest " + lang
 
     def __call__(self, contrib, old_version, new_version):
         old_doc = old_version.document if old_version else None
@@ -266,6 +463,8 @@ class NewbieTest(object):
 
         self.fail_marker = emoji("/images/emoji/apple/gift.png?v=3", self.name)
         self.success_marker = ""
+        self.depends_on = None  # user status, always evaluated
+        self.cache_key = None
 
     def __call__(self, contrib, old_version, new_version):
         if contrib.user.is_newbie():
@@ -282,16 +481,51 @@ class ReTest(object):
         self.fail_marker = emoji("/images/emoji/apple/red_circle.png?v=3", self.name)
         self.success_marker = emoji("/images/emoji/apple/white_check_mark.png?v=3",
                                     self.name + " corrigé")
+        self.depends_on = ("locales",)
+
+        self._pattern_set = None
+        self._index = 0
+
+    @property
+    def cache_key(self):
+        """Changes with patterns, so that stored results of old patterns are not used"""
+        return "ReTest {} {}\n{}".format(self.name, self.lang, "\n".join(self.patterns))
+
+    def set_pattern_set(self, pattern_set, index):
+        """
+        Share a pattern set with other tests
+
+        :param index: index of this test patterns in pattern set groups
+        """
+
+        self._pattern_set = pattern_set
+        self._index = index
+
+    def _get_pattern_set(self):
+        pattern_set = self._pattern_set
+
+        if pattern_set is None or pattern_set.groups[self._index] != tuple(self.patterns):
+            self.set_pattern_set(utils.PatternSet([self.patterns]), 0)
+
+        return self._pattern_set
 
     def __call__(self, contrib, old_version, new_version):
         old_doc = old_version.document if old_version else None
         new_doc = new_version.document if new_version else None
 
+        pattern_set = self._get_pattern_set()
+
         def test(doc):
             if not doc or "redirects_to" in doc:
                 return True
 
-            return not doc.search(self.patterns, self.lang)
+            locale = doc.get_locale(self.lang)
+
+            for field in locale.get_locale_fields():
+                if field in locale and locale[field] and self._index in pattern_set.search(locale[field]):
+                    return False
+
+            return True
 
         return test(old_doc), test(new_doc)
 
@@ -304,6 +538,8 @@ class HistoryTest(object):
         self.lang = lang
         self.fail_marker = emoji("/images/emoji/apple/closed_book.png?v=3", self.name)
         self.success_marker = emoji("/images/emoji/apple/green_book.png?v=3", self.name + " rempli")
+        self.depends_on = ("type", "activities", "locales.route_history")
+        self.cache_key = "HistoryTest " + lang
 
     def __call__(self, contrib, old_version, new_version):
         old_doc = old_version.document if old_version else None
@@ -330,6 +566,8 @@ class MainWaypointTest(object):
         self.name = "Main waypoint"
         self.fail_marker = emoji("https://forum.camptocamp.org/uploads/default/original/2X/f/f2c72706b83fd5bd21e110cb1b9758c763905023.png", self.name)
         self.success_marker = emoji("https://forum.camptocamp.org/uploads/default/original/2X/3/37abfd096a21bed932bea1d7150b9264abc12476.png", self.name + " corrigé")
+        self.depends_on = ("type", "main_waypoint_id")
+        self.cache_key = "MainWaypointTest"
 
     def __call__(self, contrib, old_version, new_version):
         if new_version.document.type != "r":
@@ -353,6 +591,8 @@ class RouteTypeTest(object):
         self.fail_marker = emoji("/images/emoji/apple/red_circle.png?v=3", self.name)
         self.success_marker = emoji("/images/emoji/apple/white_check_mark.png?v=3",
                                     self.name + " corrigé")
+        self.depends_on = ("type", "activities", "climbing_outdoor_type")
+        self.cache_key = "RouteTypeTest"
 
     def __call__(self, contrib, old_version, new_version):
         def test(version):
@@ -377,6 +617,8 @@ class DistanceTest(object):
         self.fail_marker = emoji("/uploads/default/original/2X/0/0178043b1b70e669946f609571bd4b8f7d18e820.png",
                                  self.name)
         self.success_marker = ""
+        self.depends_on = ("geometry",)
+        self.cache_key = "DistanceTest"
 
     def __call__(self, contrib, old_version, new_version):
         if old_version is None or new_version is None:
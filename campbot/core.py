@@ -4,15 +4,19 @@ from __future__ import print_function, unicode_literals, division
 
 import os
 import io
+import json
 import requests
 from datetime import datetime, timedelta
-from dateutil import parser
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import logging
-import time
 from . import utils
 from . import objects
+from .cache import ResponseCache, VersionStore, UserStatusStore, CheckResultStore, LruCache
+from .metrics import Metrics
+from .cassette import RecordingAdapter, ReplayAdapter
+from .throttling import AdaptiveRateLimiter, RetryPolicy, monotonic, parse_retry_after
 from campbot.processors import get_automatic_replacments
 
 try:
@@ -31,70 +35,171 @@ class UserInterrupt(BaseException):
 
 
 class BaseBot(object):
+    name = None
     min_delay = timedelta(seconds=3)
+    burst = 5
+    max_throttled_retries = 5
+    timeout = 60
+    workers = 1
 
-    def __init__(self, campbot, api_url, proxies=None, min_delay=None):
+    # PUT are not retried by default. For wiki documents, replaying a save is safe :
+    # the payload contains the document version, so a duplicate is rejected by the API.
+    retry_put = False
+
+    def __init__(self, campbot, api_url, proxies=None, min_delay=None, rate_limiter=None, retry_policy=None,
+                 response_cache=None, workers=None, metrics=None, transport=None):
         self.campbot = campbot
         self.api_url = api_url
         self._session = requests.Session()
         self.proxies = proxies
-        self._next_request_datetime = datetime.now()
         if min_delay is not None:
             self.min_delay = timedelta(seconds=float(min_delay))
 
+        if workers is not None:
+            self.workers = int(workers)
+
+        if transport is None and self.workers > requests.adapters.DEFAULT_POOLSIZE:
+            transport = requests.adapters.HTTPAdapter(pool_maxsize=self.workers)
+
+        if transport is not None:
+            for prefix in ("https://", "http://"):
+                self._session.mount(prefix, transport)
+
+        if rate_limiter is None:
+            seconds = self.min_delay.total_seconds()
+            rate_limiter = AdaptiveRateLimiter(rate=1 / seconds if seconds > 0 else float("inf"),
+                                               burst=self.burst)
+
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.response_cache = response_cache
+        self._single_flight = utils.SingleFlight()
+        self.metrics = metrics or Metrics()
+
     @property
     def headers(self):
         return self._session.headers
 
     def _wait(self):
-        to_wait = (self._next_request_datetime - datetime.now()).total_seconds()
-
-        if to_wait > 0:
-            time.sleep(to_wait)
+        return self.rate_limiter.acquire()
 
-        self._next_request_datetime = datetime.now() + self.min_delay
+    def close(self):
+        self._session.close()
 
     def get(self, url, **kwargs):
-        key = (url, str(kwargs))
+        content_type, content = self._get_content(url, kwargs)
 
-        self._wait()
-        logging.debug("GET %s", url)
+        if not content_type.startswith('application/json'):
+            return content
 
-        res = self._session.get(self.api_url + url,
-                                proxies=self.proxies,
-                                params=kwargs)
+        start = monotonic()
+        result = utils.json_loads(content)
+        self.metrics.observe_decode(self.name, url, monotonic() - start)
 
-        res.raise_for_status()
+        return result
 
-        if res.headers['Content-type'].startswith('application/json'):
-            return res.json()
-        else:
-            return res.content
+    def _get_items(self, url, content, key, others):
+        """
+        Decode a JSON object, like a documents list page
+
+        :param content: content type and raw content, as returned by _get_content
+        :param key: array member name, like "documents"
+        :param others: dict filled with other members, like "total"
+        :return: items of the array member
+        """
+
+        content_type, content = content
+
+        assert content_type.startswith('application/json')
+
+        start = monotonic()
+        data = utils.json_loads(content)
+        self.metrics.observe_decode(self.name, url, monotonic() - start)
+
+        if others is not None:
+            others.update((name, value) for name, value in data.items() if name != key)
+
+        return data[key]
+
+    def _get_content(self, url, params):
+        key = (url, str(sorted(params.items())))
+
+        # identical GET sent simultaneously by several threads are sent once
+        return self._single_flight.do(key, self._get, url, params)
+
+    def _get(self, url, params):
+        """
+        GET request, through response cache if any
+
+        :return: content type, and raw content
+        """
+
+        cache = self.response_cache
+        cached = cache.lookup(url, params) if cache else None
+
+        if cached and cached.is_fresh():
+            return cached.content_type, cached.content
+
+        headers = cached.get_conditional_headers() if cached else {}
+        res = self.retry_policy.call(self._request, "GET", url, params=params, headers=headers)
+
+        if cached and res.status_code == 304:
+            cache.refresh(cached)
+            return cached.content_type, cached.content
+
+        if cache:
+            cache.store(url, params, res)
+
+        return res.headers['Content-type'], res.content
 
     def post(self, url, data):
-        self._wait()
-        logging.debug("POST %s", url)
+        res = self._request("POST", url, json=data)
 
-        res = self._session.post(self.api_url + url, json=data, proxies=self.proxies)
+        assert res.headers['Content-type'].startswith('application/json')
 
-        res.raise_for_status()
+        return utils.json_loads(res.content)
+
+    def put(self, url, data, retry=None):
+        if self.retry_put if retry is None else retry:
+            res = self.retry_policy.call(self._request, "PUT", url, json=data)
+        else:
+            res = self._request("PUT", url, json=data)
+
+        if self.response_cache:
+            self.response_cache.invalidate(url)
 
         assert res.headers['Content-type'].startswith('application/json')
 
-        return res.json()
+        return utils.json_loads(res.content)
 
-    def put(self, url, data):
-        self._wait()
-        logging.debug("POST %s", url)
+    @property
+    def effective_rate(self):
+        """Current request rate allowed by the rate limiter, in requests per second"""
+        return self.rate_limiter.rate
 
-        res = self._session.put(self.api_url + url, json=data,
-                                proxies=self.proxies)
+    def _request(self, method, url, **kwargs):
+        for attempt in range(self.max_throttled_retries + 1):
+            self.metrics.observe_sleep(self.name, self._wait())
+            logging.debug("%s %s", method, url)
 
-        res.raise_for_status()
+            start = monotonic()
+            res = self._session.request(method, self.api_url + url, proxies=self.proxies,
+                                        timeout=self.timeout, **kwargs)
+            latency = monotonic() - start
 
-        assert res.headers['Content-type'].startswith('application/json')
+            self.metrics.observe_request(self.name, method, url, res.status_code, latency, len(res.content))
 
-        return res.json()
+            retry_after = parse_retry_after(res.headers.get("Retry-After"))
+
+            if not self.rate_limiter.on_response(res.status_code, latency, retry_after):
+                break
+
+            logging.warning("%s %s throttled with status %s, rate is now %.3f requests/s",
+                            method, url, res.status_code, self.effective_rate)
+
+        res.raise_for_status()
+
+        return res
 
 
 class WikiBot(BaseBot):
@@ -102,6 +207,13 @@ class WikiBot(BaseBot):
         Get functions for all camptocamp.org wiki
     """
 
+    name = "wiki"
+    page_size = 100  # maximum allowed by API
+
+    version_store = None
+    object_cache = None
+    user_status = None
+
     @property
     def ui_url(self):
         return self.api_url.replace("api", "www")
@@ -112,8 +224,14 @@ class WikiBot(BaseBot):
 
         constructor = objects.get_constructor(document_type)
 
-        url = "/{}/{}/{}/{}"
-        data = self.get(url.format(constructor.url_path, item_id, lang, version_id))
+        data = self.version_store.get(item_id, lang, version_id) if self.version_store else None
+
+        if data is None:
+            url = "/{}/{}/{}/{}"
+            data = self.get(url.format(constructor.url_path, item_id, lang, version_id))
+
+            if self.version_store:
+                self.version_store.put(item_id, lang, version_id, data)
 
         return objects.Version(self.campbot, data)
 
@@ -130,7 +248,46 @@ class WikiBot(BaseBot):
         if not constructor:
             constructor = objects.get_constructor(document_type)
 
-        return constructor(self.campbot, self.get("/{}/{}".format(constructor.url_path, item_id)))
+        url = "/{}/{}".format(constructor.url_path, item_id)
+
+        cached = self.object_cache.get(url) if self.object_cache is not None else None
+
+        if cached:
+            data = utils.json_loads(cached[1])
+        else:
+            data = self.get(url)
+
+            if self.object_cache is not None and isinstance(data, dict):
+                content = json.dumps(data).encode("utf-8")
+                self.object_cache.put(url, (data.get("version"), content), len(content))
+
+        return constructor(self.campbot, data)
+
+    def _invalidate_object(self, document_id, document_type, version=None):
+        """
+        Remove a document from object cache
+
+        :param version: if set, document is removed only if cached version is older
+        """
+
+        if self.object_cache is None:
+            return
+
+        url = "/{}/{}".format(objects.get_constructor(document_type).url_path, document_id)
+
+        if version is not None:
+            cached = self.object_cache.peek(url)
+
+            if not cached or cached[0] is None or cached[0] >= version:
+                return
+
+        self.object_cache.invalidate(url)
+
+    def put(self, url, data, retry=None):
+        if self.object_cache is not None:
+            self.object_cache.invalidate(url)
+
+        return super(WikiBot, self).put(url, data, retry=retry)
 
     def get_article(self, article_id):
         """
@@ -215,39 +372,138 @@ class WikiBot(BaseBot):
     def get_books(self, filters):
         return self.get_documents(constructor=objects.Book, filters=filters)
 
-    def get_documents(self, filters=None, document_type=None, constructor=None):
+    def get_documents(self, filters=None, document_type=None, constructor=None, tiled=False, lazy=False):
         """
-        Return a list of wiki objects, this function is a generator
+        Return a list of wiki objects, this function is a generator.
+        Documents are fetched ahead by ``workers`` threads, and each document is returned once.
 
         :param filters: a key-value dictionary
         :param document_type: type letter, like 'a', 'r', 'w'...
         :param constructor: objects.Area, objects.Route ...
+        :param tiled: split the query in bbox tiles, see get_documents_raw_tiled
+        :param lazy: objects are built from list items, and full documents are fetched only
+            if a missing field is accessed (attribute, item, get() or in), or on save()
         """
         if not constructor:
             constructor = objects.get_constructor(document_type=document_type)
 
-        for doc in self.get_documents_raw(constructor.url_path, filters):
-            yield self.get_wiki_object(doc["document_id"], constructor=constructor)
+        get_documents_raw = self.get_documents_raw_tiled if tiled else self.get_documents_raw
+
+        if lazy:
+            return self._get_lazy_documents(get_documents_raw(constructor.url_path, filters), constructor)
+
+        document_ids = (doc["document_id"] for doc in get_documents_raw(constructor.url_path, filters))
+
+        return utils.ordered_map(lambda document_id: self.get_wiki_object(document_id, constructor=constructor),
+                                 document_ids, workers=self.workers, key=lambda document_id: document_id)
+
+    def _get_lazy_documents(self, documents, constructor):
+        seen = set()
+
+        for document in documents:
+            if document["document_id"] not in seen:
+                seen.add(document["document_id"])
+                yield constructor(self.campbot, document, partial=True)
 
     def get_documents_raw(self, url_path, filters=None):
-        filters = filters or {}
-        filters["offset"] = 0
+        """
+        Raw documents of a list, this function is a generator. Pages of ``page_size`` documents
+        are requested ahead by ``workers`` threads, up to the total given by the first page.
+
+        :param url_path: routes, waypoints...
+        :param filters: a key-value dictionary
+        """
+
+        filters = dict(filters or {})
+        limit = int(filters.pop("limit", self.page_size))
+
+        def get_url(offset):
+            return _get_documents_url(url_path, dict(filters, offset=offset, limit=limit))
 
-        filters = {k: ",".join(map(str, v)) if isinstance(v, (list, set, tuple)) else v for k, v in filters.items()}
+        def get_page(offset):
+            url = get_url(offset)
+            logging.debug("GET %s", url)
+            return url, self._get_content(url, {})
+
+        others = {}
+        offset = 0
+        pages = iter([get_page(0)])
+        prefetched = False
 
         while True:
-            filters_url = "&".join(["{}={}".format(k, v) for k, v in filters.items()])
-            url = "/{}?{}".format(url_path, filters_url)
-            print(url)
-            data = self.get(url)
+            for url, content in pages:
+                count = 0
 
-            if len(data["documents"]) == 0:
-                return
+                for doc in self._get_items(url, content, "documents", others):
+                    count += 1
+                    yield doc
+
+                offset += count
+                logging.info("%s : %s/%s documents", url_path, offset, others.get("total", "?"))
+
+                # without total, a short page is the last one
+                if count < limit and "total" not in others:
+                    return
+
+            if "total" in others:
+                # documents added or removed meanwhile may shift pages, they are not requested again
+                if offset >= others["total"] or offset == 0 or prefetched:
+                    return
+
+                # offsets are predictable : next pages are requested concurrently. API lowers limits
+                # above its maximum, so page size is the size of the first page
+                pages = utils.ordered_map(get_page, range(offset, others["total"], offset), workers=self.workers)
+                prefetched = True
+            else:
+                pages = iter([get_page(offset)])
+
+    def get_documents_raw_tiled(self, url_path, filters=None, max_total=1000, min_size=1000):
+        """
+        Raw documents of a list, like get_documents_raw, but the query is split in bbox tiles,
+        fetched concurrently by ``workers`` threads. Tiles with more than ``max_total`` documents
+        are split in four, recursively. Each document is returned once, in no specific order.
+
+        Only documents with a geometry are returned.
+
+        :param url_path: routes, outings...
+        :param filters: a key-value dictionary. If it has a bbox, this bbox is split
+        :param max_total: maximum number of documents in a tile
+        :param min_size: in meters, tiles smaller than this are not split
+        """
+
+        filters = dict(filters or {})
+        bbox = _parse_bbox(filters.pop("bbox", None))
+
+        def get_total(tile):
+            data = self.get(_get_documents_url(url_path, dict(filters, bbox=_format_bbox(tile), limit=1)))
+            return tile, data["total"]
+
+        def get_documents(tile):
+            return list(self.get_documents_raw(url_path, dict(filters, bbox=_format_bbox(tile))))
+
+        tiles = [bbox]
+        leaves = []
+
+        while tiles:
+            next_tiles = []
+
+            for tile, total in utils.ordered_map(get_total, tiles, workers=self.workers):
+                if total > max_total and tile[2] - tile[0] > min_size:
+                    next_tiles += _split_bbox(tile)
+                elif total != 0:
+                    leaves.append(tile)
 
-            for doc in data["documents"]:
-                yield doc
+            logging.info("%s : %s tiles", url_path, len(leaves) + len(next_tiles))
+            tiles = next_tiles
 
-            filters["offset"] += 30
+        seen = set()
+
+        # documents on a tile edge are returned by both tiles
+        for documents in utils.ordered_map(get_documents, leaves, workers=self.workers):
+            for document in documents:
+                if document["document_id"] not in seen:
+                    seen.add(document["document_id"])
+                    yield document
 
     def get_user(self, user_id=None, wiki_name=None, forum_name=None):
         if user_id:
@@ -265,42 +521,159 @@ class WikiBot(BaseBot):
 
         raise Exception("Can't find user {}".format(wiki_name or forum_name))
 
-    def get_contributions(self, **kwargs):
+    def is_newbie(self, user_id):
+        """
+        :return: True if user has less than 50 contributions
+        """
+
+        newbie = self.user_status.get(user_id) if self.user_status is not None else None
 
-        oldest_date = kwargs.get("oldest_date", None) or utils.today() + timedelta(days=-1)
-        newest_date = kwargs.get("newest_date", None) or datetime.now()
+        if newbie is None:
+            contribs = self.get("/documents/changes?limit=50&u={}".format(user_id))
+            newbie = len(contribs["feed"]) < 50
 
-        if isinstance(oldest_date, basestring):
-            oldest_date = parser.parse(oldest_date)
+            if self.user_status is not None:
+                self.user_status.put(user_id, newbie)
 
-        if isinstance(newest_date, basestring):
-            newest_date = parser.parse(newest_date)
+        return newbie
+
+    def prefetch_user_status(self, user_ids):
+        """
+        Get newbie status of several users, each one once, with wiki workers
+
+        :param user_ids: iterable of user ids, duplicates are allowed
+        """
+
+        user_ids = sorted(set(user_ids))
+
+        for _ in utils.ordered_map(self.is_newbie, user_ids, workers=self.workers):
+            pass
+
+    def get_contributions(self, **kwargs):
+        """
+        Contributions, newest first, this function is a generator.
+
+        :param oldest_date: Default : yesterday
+        :param newest_date: Default : now
+        :param user_id: only contributions of this user
+        :param cursor: cache.ContributionCursor. Walk resumes where the cursor stopped, and the cursor
+            follows the walk
+        :param forward: with a cursor, only contributions newer than the newest one seen by the cursor
+        """
+
+        oldest_date, newest_date = _get_contributions_dates(kwargs.get("oldest_date", None),
+                                                            kwargs.get("newest_date", None))
 
         user_id = kwargs.get("user_id", None)
         user_filter = "&u={}".format(user_id) if user_id else ""
 
-        oldest_date = oldest_date.replace(tzinfo=pytz.UTC)
-        newest_date = newest_date.replace(tzinfo=pytz.UTC)
+        cursor = kwargs.get("cursor", None)
+        forward = cursor is not None and kwargs.get("forward", False)
+        stop_version_id = cursor.newest_version_id if forward else None
 
-        d = self.get("/documents/changes?limit=50" + user_filter)
+        def is_old(item):
+            if stop_version_id is not None and item["version_id"] <= stop_version_id:
+                return True
 
-        while True:
-            for item in d["feed"]:
-                written_at = parser.parse(item["written_at"])
-                if written_at < oldest_date:
-                    return
+            return utils.parse_datetime(item["written_at"]) < oldest_date
 
-                if newest_date > written_at:
-                    yield objects.Contribution(self.campbot, item)
+        if cursor is None or forward:
+            token, skip_version_id = None, None
+        elif cursor.done:
+            return
+        else:
+            token, skip_version_id = cursor.token, cursor.last_version_id
 
-            if "pagination_token" not in d:
-                break
+        newest_version_id = None
+        completed = False
+
+        try:
+            for token, page in self._get_contributions_pages(token, user_filter, is_old):
+                feed = page["feed"]
+
+                if skip_version_id is not None:
+                    # resumed walk : consumed contributions are skipped
+                    ids = [item["version_id"] for item in feed]
+                    start = ids.index(skip_version_id) + 1 if skip_version_id in ids else \
+                        len([i for i in ids if i >= skip_version_id])
+                    feed = feed[start:]
+                    skip_version_id = None
+
+                for item in feed:
+                    document = item["document"]
+                    self._invalidate_object(document["document_id"], document["type"], document.get("version"))
+
+                    if newest_version_id is None:
+                        newest_version_id = item["version_id"]
 
-            pagination_token = d["pagination_token"]
-            d = self.get("/documents/changes?limit=50&token=" + pagination_token + user_filter)
+                        if cursor is not None and not forward and cursor.newest_version_id is None:
+                            # fresh walk : kept by cursor from its first save, a resumed walk starts lower
+                            cursor.newest_version_id = newest_version_id
+
+                    if is_old(item):
+                        completed = True
+                        return
+
+                    if newest_date > utils.parse_datetime(item["written_at"]):
+                        yield objects.Contribution(self.campbot, item)
+
+                    if cursor is not None and not forward:
+                        cursor.token = token
+                        cursor.last_version_id = item["version_id"]
+                        cursor.last_written_at = item["written_at"]
+
+                if cursor is not None:
+                    cursor.checkpoint()
+
+            completed = True
+        finally:
+            if cursor is not None:
+                if forward and completed and newest_version_id is not None:
+                    cursor.newest_version_id = max(newest_version_id, cursor.newest_version_id or 0)
+                elif not forward:
+                    cursor.done = completed
+
+                cursor.checkpoint()
+
+    def _get_contributions_pages(self, token, user_filter, is_old):
+        """
+        Pages of contributions feed. Next page is fetched in background, while current one
+        is consumed, unless the last item of current page is already too old.
+
+        :return: generator of (pagination token, page)
+        """
+
+        def get_page(token):
+            if token is None:
+                return self.get("/documents/changes?limit=50" + user_filter)
+
+            return self.get("/documents/changes?limit=50&token=" + token + user_filter)
+
+        executor = ThreadPoolExecutor(max_workers=1)
+
+        try:
+            page = get_page(token)
+
+            while True:
+                next_token = page.get("pagination_token")
+                next_page = None
+
+                if next_token and len(page["feed"]) != 0 and not is_old(page["feed"][-1]):
+                    next_page = executor.submit(get_page, next_token)
+
+                yield token, page
+
+                if next_page is None:
+                    return
+
+                token, page = next_token, next_page.result()
+        finally:
+            executor.shutdown(wait=False)
 
 
 class ForumBot(BaseBot):
+    name = "forum"
+
     def post_message(self, message, url):
         """
         post a message into an existant forum thread
@@ -309,7 +682,7 @@ class ForumBot(BaseBot):
         :param url: thread URL
         """
 
-        topic_id, _ = self._get_post_ids(url)
+        topic_id, _ = _get_post_ids(self.api_url, url)
         self.post("/posts", {"topic_id": topic_id, "raw": message})
 
     def get_group_members(self, group_name):
@@ -339,23 +712,15 @@ class ForumBot(BaseBot):
         data = {"usernames": ",".join(users)}
         self.put("/groups/{}/members.json".format(group["basic_group"]["id"]), data)
 
-    def _get_post_ids(self, url):
-        url = url.replace(self.api_url, "").split("?")[0].split("/")
-        assert url[1] == 't'
-        topic_id = url[3]
-        post_number = int(url[4]) if len(url) >= 5 else 1
-
-        return topic_id, post_number
-
     def get_topic(self, topic_id=None, url=None):
         if url:
-            topic_id, _ = self._get_post_ids(url)
+            topic_id, _ = _get_post_ids(self.api_url, url)
 
         return self.get("/t/{}.json".format(topic_id))
 
     def get_post(self, topic_id=None, post_number=None, url=None):
         if url:
-            topic_id, post_number = self._get_post_ids(url)
+            topic_id, post_number = _get_post_ids(self.api_url, url)
 
         topic = self.get_topic(topic_id)
         post_id = topic["post_stream"]["stream"][post_number - 1]
@@ -376,11 +741,26 @@ class CampBot(object):
     * ``forum`` for interacting with camptocamp.org forum
     """
 
-    def __init__(self, min_delay=None, proxies=None, use_demo=False):
+    def __init__(self, min_delay=None, proxies=None, use_demo=False, rate_limiter=None, retry_policy=None,
+                 cache_dir=None, workers=None, record=None, replay=None, replay_latency=None, wiki_url=None,
+                 forum_url=None):
         """
-            :param min_delay: in seconds, minimum delay between each request
+            :param min_delay: in seconds, average delay between each request
             :param proxies: key-url dictionary
             :param use_demo: Boolean, True if you want to use C2C demo API
+            :param rate_limiter: throttling.TokenBucket shared by wiki and forum. By default,
+                each one has its own throttling.AdaptiveRateLimiter, built from min_delay
+            :param retry_policy: throttling.RetryPolicy used for GET requests
+            :param cache_dir: directory used to store wiki responses, versions, users status and checkers
+                results between runs, or None
+            :param workers: number of threads used to fetch wiki documents ahead. Default : 1
+            :param record: cassette file name, where all requests and responses are recorded
+            :param replay: cassette file name, requests are answered from it, without network access.
+                Default min_delay is then 0
+            :param replay_latency: on replay, factor applied to recorded latencies : None for instant answers,
+                1.0 to wait as long as recorded requests
+            :param wiki_url: wiki API URL, like a campbot.server.LocalServer URL. Overrides use_demo
+            :param forum_url: forum URL. Overrides use_demo
     
             :Example:
     
@@ -390,12 +770,41 @@ class CampBot(object):
 
         domain = "camptocamp" if not use_demo else "demov6.camptocamp"
 
-        self.wiki = WikiBot(self, "https://api.{}.org".format(domain),
-                            proxies=proxies, min_delay=min_delay)
+        self.cache_dir = cache_dir
+        """Local cache directory, or None"""
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        self.metrics = Metrics()
+        """Requests metrics, for wiki and forum"""
+
+        transport = None
+
+        if replay:
+            transport = ReplayAdapter(replay, latency_factor=replay_latency)
+            min_delay = 0 if min_delay is None else min_delay
+        elif record:
+            transport = RecordingAdapter(record)
+
+        self.wiki = WikiBot(self, wiki_url or "https://api.{}.org".format(domain),
+                            proxies=proxies, min_delay=min_delay,
+                            rate_limiter=rate_limiter, retry_policy=retry_policy,
+                            response_cache=self._get_store(ResponseCache, "responses.db"), workers=workers,
+                            metrics=self.metrics, transport=transport)
         """WikiBot instance"""
 
-        self.forum = ForumBot(self, "https://forum.{}.org".format(domain),
-                              proxies=proxies, min_delay=min_delay)
+        self.wiki.version_store = self._get_store(VersionStore, "versions.db")
+        self.wiki.object_cache = LruCache()
+        self.wiki.user_status = self._get_store(UserStatusStore, "users.db") or UserStatusStore(":memory:")
+
+        self.check_results = self._get_store(CheckResultStore, "checks.db")
+        """checkers tests results, or None if there is no cache directory"""
+
+        self.forum = ForumBot(self, forum_url or "https://forum.{}.org".format(domain),
+                              proxies=proxies, min_delay=min_delay,
+                              rate_limiter=rate_limiter, retry_policy=retry_policy, metrics=self.metrics,
+                              transport=transport)
 
         """ForumBot instance"""
 
@@ -403,7 +812,23 @@ class CampBot(object):
         """True if logged with a moderator account"""
 
         self.forum.headers['X-Requested-With'] = "XMLHttpRequest"
-        self.forum.headers['Host'] = "forum.{}.org".format(domain)
+
+        if not forum_url:
+            self.forum.headers['Host'] = "forum.{}.org".format(domain)
+
+    def _get_store(self, constructor, filename):
+        if not self.cache_dir:
+            return None
+
+        return constructor(os.path.join(self.cache_dir, filename))
+
+    def close(self):
+        """
+            Close connections, and cassette, if any
+        """
+
+        self.wiki.close()
+        self.forum.close()
 
     def login(self, login, password):
         """
@@ -516,15 +941,21 @@ class CampBot(object):
         :param filename:
         :return: generator
         """
-        with open(filename, "r") as f:
-            for line in f:
-                item_id, item_type = line.replace(" ", "").replace("\n", "").replace("\r", "").split("|")
-                item_id = int(item_id)
-
-                try:
-                    yield self.wiki.get_wiki_object(item_id, item_type)
-                except requests.HTTPError as e:  # pragma: no cover
-                    print("{error}, item skipped".format(error=e))
+        def get_items():
+            with open(filename, "r") as f:
+                for line in f:
+                    item_id, item_type = line.replace(" ", "").replace("\n", "").replace("\r", "").split("|")
+                    yield int(item_id), item_type
+
+        def get_document(item):
+            try:
+                return self.wiki.get_wiki_object(item[0], item[1])
+            except requests.HTTPError as e:  # pragma: no cover
+                print("{error}, item skipped".format(error=e))
+
+        for document in utils.ordered_map(get_document, get_items(), workers=self.wiki.workers, key=lambda item: item):
+            if document is not None:
+                yield document
 
     def _get_documents_from_url(self, url):
         """
@@ -656,9 +1087,17 @@ class CampBot(object):
                       title=c.document.title.replace(";", ","), quality=c.document.quality,
                       user=c.user.username, lang=c.lang)
 
-    def get_modified_documents(self, lang, oldest_date=None, newest_date=None, excluded_users=()):
+    def get_modified_documents(self, lang, oldest_date=None, newest_date=None, excluded_users=(), contributions=None):
+        """
+        :param contributions: contributions to group, default is contributions between oldest and newest dates
+        :return: contributions by document key
+        """
+
+        if contributions is None:
+            contributions = self.wiki.get_contributions(oldest_date=oldest_date, newest_date=newest_date)
+
         result = OrderedDict()
-        for contrib in self.wiki.get_contributions(oldest_date=oldest_date, newest_date=newest_date):
+        for contrib in contributions:
             if contrib.lang == lang and \
                     contrib.document.type not in ("i", "o", "x") and \
                     contrib.document.type != "m" and \
@@ -672,22 +1111,24 @@ class CampBot(object):
 
         return result
 
-    def fix_recent_changes(self, oldest_date, newest_date, lang, ask_before_saving):
+    def fix_recent_changes(self, oldest_date, newest_date, lang, ask_before_saving, contributions=None,
+                           processors=None):
 
         excluded_ids = [996571, ]
 
-        processors = get_automatic_replacments(self)
+        if processors is None:
+            processors = get_automatic_replacments(self)
 
         def get_documents():
+            keys = [(document_id, document_type)
+                    for document_id, document_type in self.get_modified_documents(lang, oldest_date, newest_date,
+                                                                                  ("rabot", "robot.topoguide",
+                                                                                   "botopo", "CaBot"),
+                                                                                  contributions)
+                    if document_id not in excluded_ids]
 
-            for document_id, document_type in self.get_modified_documents(lang, oldest_date, newest_date,
-                                                                          ("rabot", "robot.topoguide", "botopo",
-                                                                           "CaBot")):
-
-                document = self.wiki.get_wiki_object(document_id, document_type=document_type)
-
-                if document_id not in excluded_ids:
-                    yield document
+            return utils.ordered_map(lambda key: self.wiki.get_wiki_object(key[0], document_type=key[1]),
+                                     keys, workers=self.wiki.workers)
 
         print("Fix recent changes")
         self._process_documents(get_documents(), processors, [lang, ], ask_before_saving)
@@ -797,7 +1238,7 @@ class CampBot(object):
         """
 
         result = {}
-        for outing in self.wiki.get_outings({"r": route_id}):
+        for outing in self.wiki.get_documents(constructor=objects.Outing, filters={"r": route_id}):
             for user in outing.associations["users"]:
                 result[user["document_id"]] = user
 
@@ -820,7 +1261,7 @@ class CampBot(object):
 
         result = []
 
-        for document in self.wiki.get_documents(constructor=constructor, filters=filters):
+        for document in self.wiki.get_documents(constructor=constructor, filters=filters, lazy=True):
             result.append({
                 "document": document,
                 "distance": utils.compute_distance(fake_object, document)
@@ -830,6 +1271,66 @@ class CampBot(object):
 
         return result
 
+
+def _get_documents_url(url_path, filters):
+    filters = {k: ",".join(map(str, v)) if isinstance(v, (list, set, tuple)) else v for k, v in filters.items()}
+    return "/{}?{}".format(url_path, "&".join(["{}={}".format(k, v) for k, v in filters.items()]))
+
+
+_world_bbox = (-20037508, -20037508, 20037508, 20037508)  # EPSG:3857
+
+
+def _parse_bbox(bbox):
+    """
+    :param bbox: "x1,y1,x2,y2" in EPSG:3857, possibly URL-encoded, or None for the whole world
+    :return: tuple of integers
+    """
+
+    if not bbox:
+        return _world_bbox
+
+    bbox = bbox.replace("%252C", ",").replace("%2C", ",")
+    return tuple(int(float(value)) for value in bbox.split(","))
+
+
+def _format_bbox(bbox):
+    return ",".join(map(str, bbox))
+
+
+def _split_bbox(bbox):
+    x1, y1, x2, y2 = bbox
+    x, y = (x1 + x2) // 2, (y1 + y2) // 2
+
+    return [(x1, y1, x, y), (x, y1, x2, y), (x1, y, x, y2), (x, y, x2, y2)]
+
+
+def _get_contributions_dates(oldest_date=None, newest_date=None):
+    oldest_date = oldest_date or utils.today() + timedelta(days=-1)
+    newest_date = newest_date or datetime.now()
+
+    if isinstance(oldest_date, basestring):
+        oldest_date = utils.parse_datetime(oldest_date)
+
+    if isinstance(newest_date, basestring):
+        newest_date = utils.parse_datetime(newest_date)
+
+    return oldest_date.replace(tzinfo=pytz.UTC), newest_date.replace(tzinfo=pytz.UTC)
+
+
+def _get_post_ids(api_url, url):
+    """
+    :param url: forum post URL, like https://forum.camptocamp.org/t/topic-name/201480/3
+    :return: topic id, and post number
+    """
+
+    url = url.replace(api_url, "").split("?")[0].split("/")
+    assert url[1] == 't'
+    topic_id = url[3]
+    post_number = int(url[4]) if len(url) >= 5 else 1
+
+    return topic_id, post_number
+
+
 def _parse_filter(url):
     url = url.replace("https://www.camptocamp.org/", "")
 
@@ -6,6 +6,7 @@ import sqlite3
 import re
 
 from campbot import CampBot
+from campbot.cache import ContributionCursor
 from requests.exceptions import HTTPError
 
 from copy import deepcopy
@@ -266,15 +267,27 @@ class Dump(object):
 
         return result[0] if result else 0
 
-    def complete_contributions(self):
+    def complete_contributions(self, cursor_filename=None):
+        """
+        :param cursor_filename: JSON file where feed position is saved. An interrupted run resumes
+            from it, and once the whole feed is dumped, next runs only get newest contributions.
+        """
+
         bot = CampBot(min_delay=0.01)
 
-        highest_version_id = self.get_highest_version_id("contribution")
+        cursor = None
+        if cursor_filename:
+            cursor = ContributionCursor(cursor_filename, autosave=False)
+        else:
+            highest_version_id = self.get_highest_version_id("contribution")
 
         cur = self._conn.cursor()
 
-        for i, contrib in enumerate(bot.wiki.get_contributions(oldest_date="1990-12-25")):
-            if highest_version_id >= contrib.version_id:
+        contributions = bot.wiki.get_contributions(oldest_date="1990-12-25", cursor=cursor,
+                                                   forward=cursor is not None and cursor.done)
+
+        for i, contrib in enumerate(contributions):
+            if cursor is None and highest_version_id >= contrib.version_id:
                 break
 
             print(contrib.written_at, contrib.version_id, contrib.user.username)
@@ -290,8 +303,16 @@ class Dump(object):
             except sqlite3.IntegrityError:
                 pass
 
+            if cursor is not None and i % 100 == 99:
+                # cursor is saved only once its contributions are committed
+                self._conn.commit()
+                cursor.save()
+
         self._conn.commit()
 
+        if cursor is not None:
+            cursor.save()
+
     def complete(self):
 
         bot = CampBot(min_delay=0.01)
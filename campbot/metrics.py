@@ -0,0 +1,193 @@
+# coding: utf-8
+
+"""
+Instrumentation of requests sent to camptocamp.org : counters, bytes, status codes
+and latency per endpoint, and time spent in rate limiter.
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import io
+import re
+import threading
+
+from .throttling import monotonic
+
+__all__ = ['Metrics', 'get_endpoint_template']
+
+
+def get_endpoint_template(url):
+    """
+    :param url: URL without host, like /routes/123?pl=fr
+
+    :return: endpoint template, like /routes/{id}
+    """
+
+    path = url.split("?")[0]
+    path = re.sub(r"/\d+(?=/|\.|$)", "/{id}", path)
+    path = re.sub(r"/\{id\}/[a-z]{2}/\{id\}$", "/{id}/{lang}/{id}", path)
+
+    return path
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join('{}="{}"'.format(k, _escape(v)) for k, v in sorted(labels.items())) + "}"
+
+
+class _EndpointStats(object):
+    def __init__(self, buckets):
+        self.statuses = {}
+        self.bytes = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.buckets = [0] * len(buckets)
+        self.decode_sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self.statuses.values())
+
+    @property
+    def errors(self):
+        return sum(count for status, count in self.statuses.items() if status >= 400)
+
+
+class Metrics(object):
+    """
+    Thread safe collector of request metrics, shared by wiki and forum bots.
+    """
+
+    latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._sleep = {}
+        self._started_at = monotonic()
+
+    def observe_request(self, bot, method, url, status_code, latency, size):
+        """
+        :param bot: bot name, wiki or forum
+        :param method: HTTP method
+        :param url: URL, without host
+        :param status_code: HTTP status
+        :param latency: in seconds
+        :param size: response size, in bytes
+        """
+
+        with self._lock:
+            stats = self._get_stats(bot, method, url)
+            stats.statuses[status_code] = stats.statuses.get(status_code, 0) + 1
+            stats.bytes += size
+            stats.latency_sum += latency
+            stats.latency_max = max(stats.latency_max, latency)
+
+            for i, bucket in enumerate(self.latency_buckets):
+                if latency <= bucket:
+                    stats.buckets[i] += 1
+
+    def observe_decode(self, bot, url, seconds):
+        """
+        :param bot: bot name, wiki or forum
+        :param url: URL of GET request, without host
+        :param seconds: time spent decoding JSON response
+        """
+
+        with self._lock:
+            self._get_stats(bot, "GET", url).decode_sum += seconds
+
+    def _get_stats(self, bot, method, url):
+        key = (bot, method, get_endpoint_template(url))
+        stats = self._endpoints.get(key)
+
+        if stats is None:
+            stats = self._endpoints[key] = _EndpointStats(self.latency_buckets)
+
+        return stats
+
+    def observe_sleep(self, bot, seconds):
+        """
+        :param bot: bot name, wiki or forum
+        :param seconds: time spent waiting for rate limiter
+        """
+
+        with self._lock:
+            self._sleep[bot] = self._sleep.get(bot, 0.0) + seconds
+
+    def to_prometheus(self):
+        """
+        :return: all metrics, in Prometheus text format
+        """
+
+        lines = []
+
+        def header(name, help_text, metric_type):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, metric_type))
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            header("campbot_requests_total", "Number of HTTP requests", "counter")
+            for (bot, method, endpoint), stats in endpoints:
+                for status, count in sorted(stats.statuses.items()):
+                    labels = _labels(bot=bot, method=method, endpoint=endpoint, status=status)
+                    lines.append("campbot_requests_total{} {}".format(labels, count))
+
+            header("campbot_response_bytes_total", "Size of HTTP responses", "counter")
+            for (bot, method, endpoint), stats in endpoints:
+                labels = _labels(bot=bot, method=method, endpoint=endpoint)
+                lines.append("campbot_response_bytes_total{} {}".format(labels, stats.bytes))
+
+            header("campbot_request_duration_seconds", "HTTP requests latency", "histogram")
+            for (bot, method, endpoint), stats in endpoints:
+                for bucket, count in zip(self.latency_buckets, stats.buckets):
+                    le = "+Inf" if bucket == float("inf") else repr(bucket)
+                    labels = _labels(bot=bot, method=method, endpoint=endpoint, le=le)
+                    lines.append("campbot_request_duration_seconds_bucket{} {}".format(labels, count))
+
+                labels = _labels(bot=bot, method=method, endpoint=endpoint)
+                lines.append("campbot_request_duration_seconds_sum{} {}".format(labels, stats.latency_sum))
+                lines.append("campbot_request_duration_seconds_count{} {}".format(labels, stats.count))
+
+            header("campbot_json_decode_seconds_total", "Time spent decoding JSON responses", "counter")
+            for (bot, method, endpoint), stats in endpoints:
+                labels = _labels(bot=bot, method=method, endpoint=endpoint)
+                lines.append("campbot_json_decode_seconds_total{} {}".format(labels, stats.decode_sum))
+
+            header("campbot_rate_limiter_sleep_seconds_total", "Time spent waiting for rate limiter", "counter")
+            for bot, seconds in sorted(self._sleep.items()):
+                lines.append("campbot_rate_limiter_sleep_seconds_total{} {}".format(_labels(bot=bot), seconds))
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename):
+        with io.open(filename, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+
+    def get_summary(self):
+        """
+        :return: human readable summary, one line per endpoint
+        """
+
+        result = []
+
+        with self._lock:
+            for (bot, method, endpoint), stats in sorted(self._endpoints.items(),
+                                                         key=lambda item: -item[1].latency_sum):
+                result.append("{} {} {} : {} requests, {} errors, {:.1f} kB, "
+                              "mean {:.3f} s, max {:.3f} s, total {:.1f} s, decoding {:.3f} s".format(
+                                  bot, method, endpoint, stats.count, stats.errors, stats.bytes / 1024,
+                                  stats.latency_sum / (stats.count or 1), stats.latency_max, stats.latency_sum,
+                                  stats.decode_sum))
+
+            for bot, seconds in sorted(self._sleep.items()):
+                result.append("{} rate limiter : {:.1f} s waiting".format(bot, seconds))
+
+            result.append("Elapsed : {:.1f} s".format(monotonic() - self._started_at))
+
+        return "\n".join(result)
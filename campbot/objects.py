@@ -25,6 +25,7 @@ We try to use the second way every times it's possible in this documentation.
 from __future__ import print_function, unicode_literals, division
 
 import re
+from copy import deepcopy
 from .differ import get_diff_report
 
 
@@ -59,14 +60,40 @@ class BotObject(dict):
 
     # make instance.key equivalent to instance["key"]
     def __getattr__(self, item):
-        if item.startswith("_"):
-            raise AttributeError("Object {} has not attribute {}".format(self.__class__.name, item))
-
-        if item not in self:  # pragma: no cover
-            raise AttributeError("Object {} has not attribute {}".format(self.__class__.name, item))
+        if item.startswith("_") or (not dict.__contains__(self, item) and
+                                    (not self._hydrate() or not dict.__contains__(self, item))):
+            raise AttributeError("Object {} has not attribute {}".format(self.__class__.__name__, item))
 
         return self[item]
 
+    def __missing__(self, key):
+        if self._hydrate():
+            return self[key]
+
+        raise KeyError(key)
+
+    def _hydrate(self):
+        """
+        Complete partial data, if any
+
+        :return: True if data has been completed
+        """
+
+        return False
+
+    def __deepcopy__(self, memo):
+        # the bot is shared by all copies
+        result = self.__class__.__new__(self.__class__)
+        memo[id(self)] = result
+
+        for key, value in self.__dict__.items():
+            result.__dict__[key] = value if key == "_campbot" else deepcopy(value, memo)
+
+        for key, value in self.items():
+            dict.__setitem__(result, key, deepcopy(value, memo))
+
+        return result
+
     def __setattr__(self, key, value):
         if key in self:
             self[key] = value
@@ -128,6 +155,10 @@ class Locale(BotObject):
     Locale is a set of field, given a lang.
     """
 
+    def _hydrate(self):
+        document = self.__dict__.get("_document")
+        return document is not None and document._hydrate()
+
     def get_title(self):
         """
         Get the title, with prefix if it exists.
@@ -168,7 +199,12 @@ class WikiObject(BotObject):
 
     url_path = None
 
-    def __init__(self, campbot, data):
+    def __init__(self, campbot, data, partial=False):
+        """
+        :param partial: True if data is incomplete, like a list item. Full document is then fetched
+            on first access to a missing field, or on save()
+        """
+
         super(WikiObject, self).__init__(campbot, data)
 
         if "associations" in self and self["associations"] is not None:
@@ -177,6 +213,75 @@ class WikiObject(BotObject):
             
         self._convert_list("locales", Locale)
         self._data = data
+        self._partial = partial
+
+        if partial:
+            for locale in self.get("locales", []):
+                locale._document = self
+
+    def is_partial(self):
+        """
+        :return: True if full document has not been fetched yet
+        """
+
+        return self.__dict__.get("_partial", False)
+
+    # on a partial object, a missing key may only be missing from list item : full document is fetched
+    def __contains__(self, key):
+        if dict.__contains__(self, key):
+            return True
+
+        return not str(key).startswith("_") and self._hydrate() and dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def hydrate(self):
+        """
+        Fetch full document, and complete this object with it. Fields set on this object are kept,
+        unless the document has been modified since this object was built.
+        """
+
+        self._hydrate()
+
+    def _hydrate(self):
+        if not self.is_partial():
+            return False
+
+        full = self._campbot.wiki.get_wiki_object(self["document_id"], constructor=self.__class__)
+        self._partial = False
+        same_version = full.get("version") == self.get("version")
+
+        for key, value in full.items():
+            if key == "geometry" and same_version and value and self.get("geometry"):
+                value = dict(value, **self["geometry"])  # list items have no geom_detail
+                dict.__setitem__(self, key, value)
+            elif key != "locales" and (key not in self or not same_version):
+                dict.__setitem__(self, key, value)
+
+        # Locale objects already given to caller are completed in place
+        locales = {locale["lang"]: locale for locale in self.get("locales", [])}
+        result = []
+
+        for locale in full.get("locales", []):
+            existing = locales.get(locale["lang"])
+
+            if existing is None:
+                result.append(locale)
+            else:
+                for key, value in locale.items():
+                    if key not in existing or not same_version:
+                        dict.__setitem__(existing, key, value)
+
+                existing.__dict__.pop("_document", None)
+                result.append(existing)
+
+        if "locales" in full:
+            dict.__setitem__(self, "locales", result)
+
+        self._data = full._data
+
+        return True
 
     def get_url(self, lang=None):
         """
@@ -254,6 +359,7 @@ class WikiObject(BotObject):
         :return: raw request response, useless.
         """
 
+        self._hydrate()
         self.print_diff()
 
         if ask_before_saving:
@@ -284,8 +390,7 @@ class ShortWikiUser(BotObject):
         return "{}/whatsnew#u={}".format(self._campbot.wiki.ui_url, self.user_id)
 
     def is_newbie(self):
-        contribs = self._campbot.wiki.get("/documents/changes?limit=50&u={}".format(self.user_id))
-        return len(contribs["feed"]) < 50
+        return self._campbot.wiki.is_newbie(self.user_id)
 
     def get_wiki_user(self):
         return self._campbot.wiki.get_user(user_id=self.user_id)
@@ -0,0 +1,705 @@
+# coding: utf-8
+
+"""
+Local stand-in for camptocamp.org wiki and forum APIs, used for load tests and benchmarks.
+
+It serves documents, versions and contributions feed, with the same pagination than
+camptocamp.org (offset/limit for documents, pagination_token for contributions), answers
+429 with a Retry-After header above a given rate, and may add latency to each response.
+
+Data is synthetic, or read from a :class:`campbot.dump.Dump` SQLite file :
+
+.. code-block:: bash
+
+    python -m campbot.server --port=8080 --documents=10000 --rate=20 --latency=0.1
+
+.. code-block:: python
+
+    from campbot import CampBot
+
+    bot = CampBot(wiki_url="http://localhost:8080", forum_url="http://localhost:8080", min_delay=0)
+
+Document filters other than offset, limit and bbox are ignored. Forum serves topics and posts,
+with the topic holding checks configuration (see :func:`campbot.checkers.get_check_message_url`).
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import bisect
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+try:  # py3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qsl
+except ImportError:  # py2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qsl
+
+from . import objects
+from .throttling import TokenBucket
+
+__all__ = ['ServerData', 'LocalServer']
+
+_usage = """
+Local camptocamp.org API, for load tests
+
+Usage:
+  python -m campbot.server [--port=<port>] [--dump=<filename>] [--documents=<count>] [--rate=<requests>] [--latency=<seconds>]
+
+Options:
+  --port=<port>           Listening port. Default : 8080
+  --dump=<filename>       Dump SQLite file used as data source. Default : synthetic data
+  --documents=<count>     Number of synthetic documents. Default : 1000
+  --rate=<requests>       Requests per second allowed before answering 429. Default : no limit
+  --latency=<seconds>     Delay added to each response. Default : 0
+"""
+
+
+_document_types = {objects.get_constructor(t).url_path: t for t in "uawoimxcbr"}
+
+_check_topic_id = 201480
+_check_configuration = """## Fautes d'orthographe courantes
+
+* Erreur : :x:
+* Corrigé : :white_check_mark:
+
+    \\betre\\b
+    \\bdeja\\b
+"""
+
+
+def _format_date(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%S.%f+00:00")
+
+
+def _get_point(document):
+    """
+    :return: (x, y) of document point, or None
+    """
+
+    geometry = document.get("geometry")
+
+    if not geometry or not geometry.get("geom"):
+        return None
+
+    coordinates = json.loads(geometry["geom"]).get("coordinates")
+
+    if not coordinates or isinstance(coordinates[0], list):  # only points are indexed
+        return None
+
+    return coordinates[0], coordinates[1]
+
+
+class _Version(object):
+    def __init__(self, version_id, document, lang, user, written_at, comment):
+        self.version_id = version_id
+        self.document = document
+        self.lang = lang
+        self.user = user
+        self.written_at = written_at
+        self.comment = comment
+
+
+class ServerData(object):
+    """
+    Documents, users and history served by LocalServer
+    """
+
+    def __init__(self):
+        self.documents = {}  # document_id => list of _Version, oldest first
+        self.users = {}
+        self._versions = []  # all versions, sorted on version_id
+        self._version_ids = []
+        self._lock = threading.Lock()
+        self._next_version_id = 1
+        self._ids_by_type = {}  # type => document ids, sorted
+        self._points = {}  # document_id => (x, y) of current version, or None
+        self.topics = {}  # topic_id => list of post ids
+        self.posts = {}
+
+        self.add_post(_check_topic_id, _check_configuration)
+
+    def add_user(self, user_id, name, written_at=None):
+        self.users[user_id] = {"user_id": user_id, "name": name, "username": name, "lang": "fr"}
+
+        self.add_version({"document_id": user_id, "type": "u", "name": name, "forum_username": name,
+                          "locales": [{"lang": "fr", "title": "", "description": None}],
+                          "associations": None, "geometry": None},
+                         user_id=user_id, written_at=written_at)
+
+    def add_version(self, document, user_id, lang="fr", written_at=None, comment="", version_id=None):
+        """
+        Add a new version of a document, it becomes the current one
+
+        :param document: full document data, with document_id and type
+        """
+
+        with self._lock:
+            history = self.documents.setdefault(document["document_id"], [])
+
+            document = deepcopy(document)
+            document["version"] = len(history) + 1
+
+            if version_id is None:
+                version_id = self._next_version_id
+
+            self._next_version_id = max(self._next_version_id, version_id + 1)
+
+            user = self.users.get(user_id) or {"user_id": user_id, "name": str(user_id),
+                                               "username": str(user_id), "lang": "fr"}
+            version = _Version(version_id, document, lang, user, written_at or datetime.utcnow(), comment)
+
+            if history and history[-1].document["type"] != document["type"]:
+                ids = self._ids_by_type[history[-1].document["type"]]
+                ids.pop(bisect.bisect_left(ids, document["document_id"]))
+
+            if not history or history[-1].document["type"] != document["type"]:
+                bisect.insort(self._ids_by_type.setdefault(document["type"], []), document["document_id"])
+
+            self._points[document["document_id"]] = _get_point(document)
+
+            history.append(version)
+
+            i = bisect.bisect(self._version_ids, version_id)
+            self._version_ids.insert(i, version_id)
+            self._versions.insert(i, version)
+
+        return version
+
+    def add_post(self, topic_id, raw, username="system"):
+        """
+        Add a post at the end of a forum topic, topic is created if needed
+
+        :return: post data
+        """
+
+        with self._lock:
+            stream = self.topics.setdefault(int(topic_id), [])
+
+            post = {"id": len(self.posts) + 1, "topic_id": int(topic_id), "post_number": len(stream) + 1,
+                    "username": username, "raw": raw, "cooked": raw}
+
+            self.posts[post["id"]] = post
+            stream.append(post["id"])
+
+        return post
+
+    def get_topic(self, topic_id):
+        stream = self.topics.get(topic_id)
+
+        if stream is None:
+            return None
+
+        participants = sorted(set(self.posts[post_id]["username"] for post_id in stream))
+
+        return {"id": topic_id, "post_stream": {"stream": list(stream)},
+                "details": {"participants": [{"username": username} for username in participants]}}
+
+    def get_document(self, document_id):
+        history = self.documents.get(document_id)
+        return history[-1].document if history else None
+
+    def get_documents(self, document_type, offset=0, limit=None, bbox=None):
+        """
+        :param bbox: (x1, y1, x2, y2), only documents whose point is inside
+        :return: current documents of a type, sorted on document_id, from offset, and total number of documents
+        """
+
+        with self._lock:
+            ids = self._ids_by_type.get(document_type, [])
+
+            if bbox is not None:
+                x1, y1, x2, y2 = bbox
+                points = self._points
+                ids = [document_id for document_id in ids
+                       if points[document_id] and x1 <= points[document_id][0] <= x2 and
+                       y1 <= points[document_id][1] <= y2]
+
+            page = ids[offset:] if limit is None else ids[offset:offset + limit]
+
+            return [self.documents[document_id][-1].document for document_id in page], len(ids)
+
+    def get_version(self, document_id, lang, version_id):
+        """
+        :return: version data, like /routes/123/fr/456
+        """
+
+        history = [version for version in self.documents.get(document_id, []) if version.lang == lang]
+
+        for i, version in enumerate(history):
+            if version.version_id == version_id:
+                return {
+                    "document": version.document,
+                    "version": {"version_id": version.version_id,
+                                "user_id": version.user["user_id"],
+                                "name": version.user.get("name"),
+                                "written_at": _format_date(version.written_at),
+                                "comment": version.comment},
+                    "previous_version_id": history[i - 1].version_id if i > 0 else None,
+                    "next_version_id": history[i + 1].version_id if i + 1 < len(history) else None,
+                }
+
+        return None
+
+    def get_feed(self, limit, token=None, user_id=None):
+        """
+        :return: contributions feed, newest first, like /documents/changes
+        """
+
+        feed = []
+        next_token = None
+
+        with self._lock:
+            end = len(self._versions) if token is None else bisect.bisect_left(self._version_ids, token)
+
+            for i in range(end - 1, -1, -1):
+                version = self._versions[i]
+
+                if user_id is not None and version.user["user_id"] != user_id:
+                    continue
+
+                if len(feed) == limit:
+                    next_token = feed[-1]["version_id"]
+                    break
+
+                feed.append(self._get_feed_item(version))
+
+        result = {"feed": feed}
+
+        if next_token is not None:
+            result["pagination_token"] = str(next_token)
+
+        return result
+
+    @staticmethod
+    def _get_feed_item(version):
+        locale = [l for l in version.document["locales"] if l["lang"] == version.lang]
+
+        return {
+            "version_id": version.version_id,
+            "written_at": _format_date(version.written_at),
+            "user": version.user,
+            "comment": version.comment,
+            "lang": version.lang,
+            "document": {"document_id": version.document["document_id"],
+                         "type": version.document["type"],
+                         "title": locale[0].get("title") if locale else None,
+                         "version": version.document["version"],
+                         "quality": version.document.get("quality")},
+        }
+
+    @classmethod
+    def synthetic(cls, documents=1000, versions=3, users=20, seed=0):
+        """
+        :param documents: number of documents, half routes, half waypoints
+        :param versions: number of versions per document
+        :param users: number of contributors
+        """
+
+        rnd = random.Random(seed)
+        result = cls()
+        start = datetime(2018, 1, 1)
+
+        for user_id in range(1, users + 1):
+            result.add_user(user_id, "user {}".format(user_id), written_at=start)
+
+        edits = []
+
+        for i in range(documents):
+            document_id = 100000 + i
+            for version in range(versions):
+                edits.append((rnd.random(), document_id))
+
+        edits.sort()
+
+        for i, (_, document_id) in enumerate(edits):
+            previous = result.get_document(document_id)
+            document = previous or cls._get_synthetic_document(document_id, rnd)
+
+            document = deepcopy(document)
+            description = "Description {} ".format(i) * rnd.randint(1, 20)
+            document["locales"][0]["description"] = description
+
+            result.add_version(document, user_id=rnd.randint(1, users),
+                               written_at=start + timedelta(minutes=i), comment="Edit {}".format(i))
+
+        return result
+
+    @staticmethod
+    def _get_synthetic_document(document_id, rnd):
+        x, y = rnd.uniform(600000, 1000000), rnd.uniform(5500000, 5800000)
+
+        document = {
+            "document_id": document_id,
+            "type": "r" if document_id % 2 else "w",
+            "quality": "medium",
+            "locales": [{"lang": "fr", "title": "Document {}".format(document_id), "description": "",
+                         "title_prefix": "Summit"}],
+            "associations": {"images": [], "waypoints": [], "routes": []},
+            "geometry": {"version": 1, "geom": json.dumps({"type": "Point", "coordinates": [x, y]})},
+            "areas": [],
+        }
+
+        if document["type"] == "r":
+            document.update({"activities": ["rock_climbing"], "global_rating": "AD", "elevation_max": rnd.randint(500, 4800)})
+        else:
+            document.update({"waypoint_type": "summit", "elevation": rnd.randint(500, 4800)})
+
+        return document
+
+    @classmethod
+    def from_dump(cls, db_name):
+        """
+        Load documents and contributions from a Dump SQLite file. Properties, locales and
+        geometry are rebuilt from dump tables, associations are lost. All versions of a
+        document share its current data.
+        """
+
+        conn = sqlite3.connect(db_name)
+        result = cls()
+        documents = {}
+
+        strings = dict(conn.execute("SELECT string_id, value FROM string"))
+
+        for document_id, document_type, geom, geom_detail, geometry_version in conn.execute(
+                "SELECT document_id, type, geometry_geom, geometry_geom_detail, geometry_version FROM document"):
+            documents[document_id] = {
+                "document_id": document_id,
+                "type": document_type,
+                "locales": [],
+                "associations": {},
+                "geometry": {"geom": geom, "geom_detail": geom_detail, "version": geometry_version},
+            }
+
+        for document_id, lang, field, value in conn.execute("SELECT document_id, lang, field, value FROM locale"):
+            if document_id in documents:
+                locales = documents[document_id]["locales"]
+                locale = [l for l in locales if l["lang"] == lang]
+
+                if not locale:
+                    locale = [{"lang": lang}]
+                    locales.append(locale[0])
+
+                locale[0][strings[int(field)]] = value  # field column has text affinity
+
+        for table, is_string in (("string_property", True), ("integer_property", False),
+                                 ("real_property", False)):
+            for document_id, field, value in conn.execute(
+                    "SELECT document_id, field, value FROM {}".format(table)):
+                if document_id in documents:
+                    key = strings[field]
+
+                    if "." not in key and key not in ("document_id", "type", "version"):
+                        document = documents[document_id]
+                        value = strings[value] if is_string else value
+
+                        if key in document:  # lists are flattened in dump
+                            if not isinstance(document[key], list):
+                                document[key] = [document[key]]
+                            document[key].append(value)
+                        else:
+                            document[key] = value
+
+        users = set()
+
+        for version_id, document_id, user_id, document_type, written_at in conn.execute(
+                "SELECT version_id, document_id, user_id, type, written_at FROM contribution ORDER BY version_id"):
+            if user_id not in users:
+                users.add(user_id)
+                result.users[user_id] = {"user_id": user_id, "name": str(user_id), "username": str(user_id),
+                                         "lang": "fr"}
+
+            document = documents.get(document_id) or {"document_id": document_id, "type": document_type,
+                                                      "locales": [], "associations": {}, "geometry": None}
+            lang = document["locales"][0]["lang"] if document["locales"] else "fr"
+
+            result.add_version(document, user_id=user_id, lang=lang, version_id=version_id,
+                               written_at=datetime.strptime(written_at[:19], "%Y-%m-%dT%H:%M:%S"))
+
+        for document_id, document in documents.items():
+            if document_id not in result.documents:
+                result.add_version(document, user_id=0)
+
+        conn.close()
+
+        return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, data=None, headers=None):
+        body = json.dumps(data).encode("utf-8") if data is not None else b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length).decode("utf-8")) if length else None
+
+    def _handle(self, method):
+        server = self.server.local_server
+        body = self._read_body() if method in ("POST", "PUT") else None
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if not server.accept():
+            self._send(429, {"errors": "Too many requests"}, {"Retry-After": str(server.retry_after)})
+            return
+
+        url = urlparse(self.path)
+        params = dict(parse_qsl(url.query))
+
+        try:
+            status, data = server.answer(method, url.path, params, body)
+        except (KeyError, ValueError):
+            status, data = 400, {"errors": "Bad request"}
+
+        self._send(status, data)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class LocalServer(object):
+    """
+    Threaded HTTP server answering like camptocamp.org wiki and forum APIs. Can be used as a context manager.
+    """
+
+    def __init__(self, data=None, port=0, rate=None, burst=1, latency=0):
+        """
+        :param data: ServerData. Default : ServerData.synthetic()
+        :param port: listening port, 0 for any free port
+        :param rate: requests per second answered before 429 responses, or None
+        :param burst: number of requests allowed at once
+        :param latency: delay, in seconds, added to each response
+        """
+
+        self.data = data or ServerData.synthetic()
+        self.latency = latency
+        self.stats = {"requests": 0, "throttled": 0}
+
+        self._bucket = TokenBucket(rate, burst=burst) if rate else None
+        self.retry_after = int(math.ceil(1 / rate)) if rate else 0
+        self._lock = threading.Lock()
+
+        self._http_server = _HTTPServer(("127.0.0.1", port), _Handler)
+        self._http_server.local_server = self
+        self._thread = None
+
+        url_paths = "|".join(_document_types)
+
+        self._routes = [
+            ("GET", r"/documents/changes", self._get_changes),
+            ("GET", r"/({})".format(url_paths), self._get_documents),
+            ("GET", r"/({})/(\d+)".format(url_paths), self._get_document),
+            ("PUT", r"/({})/(\d+)".format(url_paths), self._put_document),
+            ("GET", r"/({})/(\d+)/(\w+)/(\d+)".format(url_paths), self._get_version),
+            ("POST", r"/users/login", self._login),
+            ("GET", r"/t/(\d+).json", self._get_topic),
+            ("GET", r"/posts/(\d+).json", self._get_post),
+            ("POST", r"/posts", self._add_post),
+            ("GET", r"/session/sso_login", lambda params, body: (200, {})),
+            ("GET", r"/session/csrf", lambda params, body: (200, {"csrf": "csrf"})),
+            ("GET", r"/groups/([^/]+)/members.json", lambda params, body, name: (
+                200, {"members": [], "meta": {"total": 0}})),
+        ]
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}".format(self._http_server.server_port)
+
+    def start(self):
+        """
+        Serve requests in a background thread
+
+        :return: server URL
+        """
+
+        self._thread = threading.Thread(target=self._http_server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        return self.url
+
+    def serve_forever(self):
+        self._http_server.serve_forever()
+
+    def stop(self):
+        self._http_server.shutdown()
+        self._http_server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def accept(self):
+        """
+        :return: False if request must be throttled
+        """
+
+        accepted = self._bucket is None or self._bucket.try_acquire()
+
+        with self._lock:
+            self.stats["requests"] += 1
+
+            if not accepted:
+                self.stats["throttled"] += 1
+
+        return accepted
+
+    def answer(self, method, path, params, body):
+        """
+        :return: HTTP status, and JSON data
+        """
+
+        for route_method, pattern, func in self._routes:
+            match = re.match(pattern + "$", path)
+
+            if route_method == method and match:
+                return func(params, body, *match.groups())
+
+        return 404, {"errors": "Not found"}
+
+    def _get_changes(self, params, body):
+        token = int(params["token"]) if "token" in params else None
+        user_id = int(params["u"]) if "u" in params else None
+
+        return 200, self.data.get_feed(min(int(params.get("limit", 30)), 100), token=token, user_id=user_id)
+
+    def _get_documents(self, params, body, url_path):
+        offset = int(params.get("offset", 0))
+        limit = min(int(params.get("limit", 30)), 100)
+
+        bbox = tuple(map(float, params["bbox"].split(","))) if "bbox" in params else None
+        documents, total = self.data.get_documents(_document_types[url_path], offset, limit, bbox)
+
+        result = []
+        for document in documents:
+            summary = {key: value for key, value in document.items() if key != "associations"}
+
+            if summary.get("geometry"):
+                summary["geometry"] = {key: value for key, value in summary["geometry"].items()
+                                       if key != "geom_detail"}
+
+            summary["locales"] = [{key: value for key, value in l.items()
+                                   if key in ("lang", "title", "title_prefix", "summary")}
+                                  for l in document["locales"]]
+            result.append(summary)
+
+        return 200, {"documents": result, "total": total}
+
+    def _get_document(self, params, body, url_path, document_id):
+        document = self.data.get_document(int(document_id))
+
+        if document is None:
+            return 404, {"errors": "Not found"}
+
+        return 200, document
+
+    def _put_document(self, params, body, url_path, document_id):
+        document = self.data.get_document(int(document_id))
+
+        if document is None:
+            return 404, {"errors": "Not found"}
+
+        if body["document"].get("version") != document["version"]:
+            return 409, {"errors": "Version conflict"}
+
+        self.data.add_version(body["document"], user_id=0, comment=body.get("message", ""))
+
+        return 200, {}
+
+    def _get_version(self, params, body, url_path, document_id, lang, version_id):
+        version = self.data.get_version(int(document_id), lang, int(version_id))
+
+        if version is None:
+            return 404, {"errors": "Not found"}
+
+        return 200, version
+
+    def _get_topic(self, params, body, topic_id):
+        topic = self.data.get_topic(int(topic_id))
+
+        if topic is None:
+            return 404, {"errors": "Not found"}
+
+        return 200, topic
+
+    def _get_post(self, params, body, post_id):
+        post = self.data.posts.get(int(post_id))
+
+        if post is None:
+            return 404, {"errors": "Not found"}
+
+        return 200, post
+
+    def _add_post(self, params, body):
+        if int(body["topic_id"]) not in self.data.topics:
+            return 404, {"errors": "Not found"}
+
+        return 200, self.data.add_post(body["topic_id"], body["raw"], username="bot")
+
+    def _login(self, params, body):
+        return 200, {"token": "token", "roles": [], "redirect_internal": self.url + "/session/sso_login?sso=0"}
+
+
+def main(args):
+    if args["--dump"]:
+        data = ServerData.from_dump(args["--dump"])
+    else:
+        data = ServerData.synthetic(documents=int(args["--documents"] or 1000))
+
+    server = LocalServer(data, port=int(args["--port"] or 8080),
+                         rate=float(args["--rate"]) if args["--rate"] else None,
+                         latency=float(args["--latency"] or 0))
+
+    print("Serving {} documents on {}".format(len(data.documents), server.url))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:  # pragma: no cover
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    from docopt import docopt
+
+    main(docopt(_usage))
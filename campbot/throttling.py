@@ -0,0 +1,330 @@
+# coding: utf-8
+
+"""
+Client side throttling, and retry of requests sent to camptocamp.org
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import email.utils
+import logging
+import random
+import threading
+import time
+import requests
+
+try:
+    monotonic = time.monotonic  # py3
+except AttributeError:  # py2
+    monotonic = time.time
+
+__all__ = ['TokenBucket', 'AdaptiveRateLimiter', 'RetryPolicy']
+
+
+class TokenBucket(object):
+    """
+    Token bucket rate limiter.
+
+    Tokens are refilled at ``rate`` tokens per second, up to ``burst`` tokens. Each request
+    consumes one token : after an idle period, up to ``burst`` requests are sent at once,
+    but the long term average never exceeds ``rate`` requests per second.
+
+    A single instance can be shared between several bots, and between threads.
+    """
+
+    def __init__(self, rate, burst=1, clock=monotonic, sleep=time.sleep):
+        """
+        :param rate: tokens per second, ``float("inf")`` disables throttling
+        :param burst: bucket capacity
+        :param clock: function returning seconds, must be monotonic
+        :param sleep: function used to wait
+        """
+
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+
+        self._rate = float(rate)
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last = clock()  # may be in the future, when paused
+
+    @property
+    def rate(self):
+        """Current refill rate, in tokens per second"""
+        return self._rate
+
+    @rate.setter
+    def rate(self, value):
+        if value <= 0:
+            raise ValueError("rate must be positive")
+
+        with self._lock:
+            self._refill(self._clock())
+            self._rate = float(value)
+
+    def _refill(self, now):
+        if now <= self._last:
+            return
+
+        if self._rate == float("inf"):
+            self._tokens = max(self._tokens, float(self.burst))
+        else:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last) * self._rate)
+
+        self._last = now
+
+    def reserve(self, tokens=1):
+        """
+        Consume tokens, possibly in advance.
+
+        :return: delay in seconds the caller must wait before sending its request
+        """
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= tokens
+
+            delay = max(0.0, self._last - now)
+
+            if self._tokens < 0:
+                delay += -self._tokens / self._rate
+
+            return delay
+
+    def try_acquire(self, tokens=1):
+        """
+        Consume tokens, only if they are available now
+
+        :return: True if tokens have been consumed
+        """
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+
+            if now < self._last or self._tokens < tokens:
+                return False
+
+            self._tokens -= tokens
+            return True
+
+    def pause(self, seconds):
+        """
+        Forbid any request during the given delay, and empty the bucket.
+        """
+
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens = min(self._tokens, 0.0)
+            self._last = max(self._last, now + seconds)
+
+    def on_response(self, status_code, latency, retry_after=None):
+        """
+        Called after each response. Plain token bucket only honours Retry-After header.
+
+        :param status_code: HTTP status code
+        :param latency: response time, in seconds
+        :param retry_after: delay asked by server, in seconds, or None
+
+        :return: True if the request has been throttled, and must be sent again
+        """
+
+        if retry_after:
+            self.pause(retry_after)
+
+        return False
+
+    def acquire(self, tokens=1):
+        """
+        Consume tokens, and wait until they are available
+
+        :return: time spent waiting, in seconds
+        """
+
+        delay = self.reserve(tokens)
+
+        if delay > 0:
+            self._sleep(delay)
+
+        return delay
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Token bucket driven by server feedback, following an AIMD scheme :
+
+    * on throttling (429, 503) and on server errors, rate is multiplied by ``decrease``
+    * on a success answered in less than ``latency_threshold`` seconds, ``increase`` is added to rate
+
+    Rate is kept between ``min_rate`` and the initial rate. Retry-After header is honoured.
+    """
+
+    throttling_statuses = (429, 503)
+
+    def __init__(self, rate, burst=1, min_rate=None, increase=None, decrease=0.5, latency_threshold=2.0,
+                 clock=monotonic, sleep=time.sleep):
+        """
+        :param rate: initial, and maximal rate, in requests per second
+        :param burst: bucket capacity
+        :param min_rate: minimal rate. Default : rate / 64
+        :param increase: additive increase. Default : rate / 20
+        :param decrease: multiplicative decrease factor
+        :param latency_threshold: in seconds, rate only increases if latency is below it
+        """
+
+        super(AdaptiveRateLimiter, self).__init__(rate, burst=burst, clock=clock, sleep=sleep)
+
+        self.max_rate = self.rate
+        self.min_rate = min_rate or self.max_rate / 64
+        self.increase = increase or self.max_rate / 20
+        self.decrease = decrease
+        self.latency_threshold = latency_threshold
+
+    def on_response(self, status_code, latency, retry_after=None):
+        throttled = status_code in self.throttling_statuses
+
+        if throttled or status_code >= 500:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+        elif latency <= self.latency_threshold and self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+        if throttled:
+            self.pause(retry_after or 0)
+        elif retry_after:
+            self.pause(retry_after)
+
+        return throttled
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header value, delay in seconds or HTTP date
+
+    :return: delay in seconds, or None
+    """
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    parsed = email.utils.parsedate_tz(value)
+
+    if parsed is None:
+        return None
+
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Retry policy for idempotent requests : failed calls are sent again after an
+    exponential backoff with full jitter, as long as the error is transient, the
+    number of attempts is below ``max_attempts``, and the ``deadline`` is not reached.
+    """
+
+    retry_on = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+    retry_statuses = (500, 502, 504)
+
+    def __init__(self, max_attempts=5, backoff=1.0, max_backoff=60.0, deadline=None,
+                 retry_on=None, retry_statuses=None, clock=monotonic, sleep=time.sleep, seed=None):
+        """
+        :param max_attempts: maximum number of calls, 1 means no retry
+        :param backoff: in seconds, base delay. Delay before retry n is random between 0 and backoff * 2^n
+        :param max_backoff: in seconds, maximum delay between two calls
+        :param deadline: in seconds, maximum total duration, or None
+        :param retry_on: tuple of exceptions considered as transient
+        :param retry_statuses: tuple of HTTP status considered as transient
+        """
+
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+
+        if retry_on is not None:
+            self.retry_on = retry_on
+
+        if retry_statuses is not None:
+            self.retry_statuses = retry_statuses
+
+        self._clock = clock
+        self._sleep = sleep
+        self._random = random.Random(seed)
+
+    def is_transient(self, error):
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in self.retry_statuses
+
+        return isinstance(error, self.retry_on)
+
+    def get_delay(self, attempt):
+        """
+        :param attempt: number of failed attempts
+        :return: delay before next attempt, in seconds
+        """
+
+        return self._random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def now(self):
+        """
+        :return: current time of policy clock, start time given to next_delay
+        """
+
+        return self._clock()
+
+    def next_delay(self, attempt, start, error, transient=None):
+        """
+        Decide if a failed call is retried
+
+        :param attempt: number of failed attempts, this one included
+        :param start: time of first attempt, given by now()
+        :param transient: True if error is transient. Default : is_transient(error)
+        :return: delay before next attempt, in seconds, or None if error must be raised
+        """
+
+        if transient is None:
+            transient = self.is_transient(error)
+
+        if attempt >= self.max_attempts or not transient:
+            return None
+
+        delay = self.get_delay(attempt)
+
+        if self.deadline is not None and self._clock() + delay - start > self.deadline:
+            return None
+
+        logging.warning("%s, retry %s/%s in %.1f seconds", error, attempt, self.max_attempts - 1, delay)
+
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func(*args, **kwargs), with retries
+        """
+
+        start = self.now()
+        attempt = 0
+
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                delay = self.next_delay(attempt, start, e)
+
+                if delay is None:
+                    raise
+
+                self._sleep(delay)
@@ -1,12 +1,42 @@
 import json
-from datetime import datetime
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from dateutil import parser
 from math import radians, degrees, sin, atan, sqrt, cos, atan2, pi, exp
+import re
+
+try:
+    import orjson as _fast_json
+except ImportError:
+    try:
+        import ujson as _fast_json
+    except ImportError:
+        _fast_json = None
+
+json_decoder = _fast_json.__name__ if _fast_json else "json"
+"""Name of the module used by json_loads"""
 
 
 def today():
     return datetime.today()
 
 
+def parse_datetime(value):
+    """
+    Parse an ISO 8601 timestamp, like written_at fields, with datetime.fromisoformat when
+    possible (much faster), and dateutil otherwise.
+    """
+
+    try:
+        return datetime.fromisoformat(value)
+    except (AttributeError, ValueError):  # py < 3.7, or format not handled
+        return parser.parse(value)
+
+
 def compute_distance(object1, object2):
     RADIUS = 6378137.0  # in meters on the equator
 
@@ -49,3 +79,227 @@ def compute_distance(object1, object2):
         return mercator_to_gps(geometry["coordinates"])
 
     return distance(get_gps_coordinates(object1), get_gps_coordinates(object2))
+
+
+def ordered_map(func, items, workers=1, window=None, key=None):
+    """
+    Generator of func(item) for all items, computed ahead by a pool of threads.
+    Results are yielded in items order.
+
+    :param func: function to call on each item
+    :param items: iterable, consumed in the calling thread
+    :param workers: number of threads. 1 means no thread at all
+    :param window: maximum number of results computed ahead. Default : 2 * workers
+    :param key: if set, items with an already seen key are skipped
+    """
+
+    seen = set()
+
+    def get_items():
+        for item in items:
+            if key is not None:
+                item_key = key(item)
+
+                if item_key in seen:
+                    continue
+
+                seen.add(item_key)
+
+            yield item
+
+    if workers <= 1:
+        for item in get_items():
+            yield func(item)
+
+        return
+
+    window = window or 2 * workers
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+
+    try:
+        for item in get_items():
+            pending.append(executor.submit(func, item))
+
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+        executor.shutdown(wait=False)
+
+
+_global_flags = re.compile(r"^\(\?([aiLmsux]+)\)")
+_back_reference = re.compile(r"\\[1-9]|\(\?P=")
+
+
+def _combine_patterns(patterns):
+    """
+    :return: one compiled alternation of all patterns, or None if they can't be safely combined
+    """
+
+    parts = []
+
+    for pattern in patterns:
+        if _back_reference.search(pattern):  # group numbers are shifted in an alternation
+            return None
+
+        # leading global flags, like (?i), are only allowed at start of expression : they become scoped
+        parts.append(_global_flags.sub(r"(?\1:", pattern) + ")" if _global_flags.match(pattern)
+                     else "(?:" + pattern + ")")
+
+    try:
+        return re.compile("|".join(parts))
+    except re.error:
+        return None
+
+
+class PatternSet(object):
+    """
+    Set of regular expression groups, searched together : a text is scanned once with a combined
+    expression of all patterns, and groups are checked one by one only if something is found.
+    Results are memoized per text.
+
+    When patterns can't be combined (back references, flags...), they are searched one by one.
+    """
+
+    max_memo = 1000
+
+    def __init__(self, groups):
+        """
+        :param groups: list of pattern lists
+        """
+
+        self.groups = [tuple(patterns) for patterns in groups]
+
+        self._any = _combine_patterns([pattern for patterns in self.groups for pattern in patterns])
+        self._groups = []
+
+        for patterns in self.groups:
+            combined = _combine_patterns(patterns)
+            self._groups.append([combined] if combined else [re.compile(pattern) for pattern in patterns])
+
+        self._memo = {}
+
+    def search(self, text):
+        """
+        :return: frozenset of indexes of groups with a pattern found in text
+        """
+
+        result = self._memo.get(text)
+
+        if result is None:
+            if self._any is not None and not self._any.search(text):
+                result = frozenset()
+            else:
+                result = frozenset(i for i, regexes in enumerate(self._groups)
+                                   if any(regex.search(text) for regex in regexes))
+
+            if len(self._memo) >= self.max_memo:
+                self._memo.clear()
+
+            self._memo[text] = result
+
+        return result
+
+
+class Progress(object):
+    """
+    Progress of a long task, logged at most every ``interval`` seconds, with remaining time estimation.
+    """
+
+    def __init__(self, label, total, interval=10, clock=time.time):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.interval = interval
+
+        self._clock = clock
+        self._start = clock()
+        self._last_log = None
+
+    def get_eta(self):
+        """
+        :return: estimated remaining time in seconds, or None if nothing is done yet
+        """
+
+        if self.done == 0:
+            return None
+
+        return (self._clock() - self._start) / self.done * (self.total - self.done)
+
+    def update(self, count=1):
+        self.done += count
+        now = self._clock()
+
+        if self.done >= self.total or self._last_log is None or now - self._last_log >= self.interval:
+            self._last_log = now
+            logging.info("%s : %s/%s, %s remaining", self.label, self.done, self.total,
+                         timedelta(seconds=int(self.get_eta())))
+
+
+class SingleFlight(object):
+    """
+    Collapse concurrent calls sharing the same key into a single call : callers arriving
+    while a call is in flight wait for it, and get its result (or its exception).
+    """
+
+    class _Call(object):
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+        """Number of calls that have been collapsed"""
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+            call.event.set()
+
+        return call.result
+
+
+def json_loads(content):
+    """
+    Decode JSON, with orjson or ujson when one of them is installed
+
+    :param content: UTF-8 encoded bytes
+    """
+
+    if _fast_json is not None:
+        return _fast_json.loads(content)
+
+    return json.loads(content.decode("utf-8"))
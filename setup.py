@@ -13,6 +13,10 @@ setup(
     description="Package for automatic edition of camptocamp.org",
     long_description=open('README.txt').read(),
     install_requires=install_requires,
+    extras_require={
+        "async": ["aiohttp"],
+        "fast": ["orjson"],
+    },
     include_package_data=True,
 
     url='http://github.com/c2corg/CampBot',
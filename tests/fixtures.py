@@ -57,11 +57,11 @@ messages = [
     _wiki('GET', r'xreports/\d+', {}),
     _wiki('GET', r'maps/\d+', {}),
 
-    # document list
+    # document list, same page is answered for all offsets : total is the number of documents in it
     _wiki('GET', r'outings(\?.*)?', get_message("outings")),
-    _wiki('GET', r'routes(\?.*)?', get_message("routes")),
+    _wiki('GET', r'routes(\?.*)?', dict(get_message("routes"), total=30)),
     _wiki('GET', r'xreports(\?.*)?', get_message("xreports")),
-    _wiki('GET', r'waypoints(\?.*)?', get_message("routes")),
+    _wiki('GET', r'waypoints(\?.*)?', dict(get_message("routes"), total=30)),
 
     # recent changes
     _wiki("GET", r"documents/changes\?limit=50&token=1687339", {"feed": []}),
@@ -86,6 +86,71 @@ messages = [
 ]
 
 
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, data=None, headers=None):
+        self.status_code = status_code
+        self.headers = {"Content-type": "application/json"}
+        self.headers.update(headers or {})
+        self._data = data
+
+    def raise_for_status(self):
+        from requests import HTTPError
+
+        if self.status_code >= 400:
+            raise HTTPError(self.status_code, response=self)
+
+    def json(self):
+        return self._data
+
+    @property
+    def content(self):
+        return json.dumps(self._data).encode("utf-8")
+
+
+class Spy(object):
+    """
+    Checker test wrapper, appending test class name to calls on each evaluation
+    """
+
+    def __init__(self, test, calls):
+        self.test = test
+        self.calls = calls
+
+    def __getattr__(self, item):
+        return getattr(self.test, item)
+
+    def __call__(self, contrib, old_version, new_version):
+        self.calls.append(self.test.__class__.__name__)
+        return self.test(contrib, old_version, new_version)
+
+
+def get_local_bot(server, **kwargs):
+    from campbot import CampBot
+
+    return CampBot(wiki_url=server.url, forum_url=server.url, min_delay=0, **kwargs)
+
+
+@pytest.fixture()
+def local_server():
+    from campbot.server import LocalServer, ServerData
+
+    with LocalServer(ServerData.synthetic(documents=70, versions=2, users=5)) as server:
+        yield server
+
+
 @pytest.yield_fixture()
 def fix_dump():
     from campbot import dump
@@ -114,7 +179,7 @@ def fix_requests():
 
     class Response(object):
         def __init__(self, method, url, **kwargs):
-            self.status = 200
+            self.status_code = 200
             self.headers = {}
 
             self._data = None
@@ -129,7 +194,7 @@ def fix_requests():
             print(method, url, self._data)
 
             if isinstance(self._data, Exception):
-                self.status = 500
+                self.status_code = 500
 
         def raise_for_status(self):
             pass
@@ -139,12 +204,20 @@ def fix_requests():
 
         @property
         def content(self):
+            if isinstance(self._data, Exception):
+                raise self._data
+
+            if isinstance(self._data, dict):
+                return json.dumps(self._data).encode("utf-8")
+
             return self._data
 
     def request(self, method, url, **kwargs):
         return Response(method, url, **kwargs)
 
     today = utils.today
+    min_delay = core.BaseBot.min_delay
+    session_request = Session.request
 
     utils.today = lambda: datetime.datetime(year=2017, month=12, day=21)
     core.BaseBot.min_delay = datetime.timedelta(seconds=0.001)
@@ -153,6 +226,8 @@ def fix_requests():
     yield
 
     utils.today = today
+    core.BaseBot.min_delay = min_delay
+    Session.request = session_request
 
 
 @pytest.yield_fixture()
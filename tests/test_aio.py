@@ -0,0 +1,100 @@
+# coding: utf-8
+
+import asyncio
+import json
+import re
+import threading
+
+import pytest
+
+from tests.fixtures import messages
+
+aiohttp = pytest.importorskip("aiohttp")
+
+
+@pytest.fixture()
+def local_server():
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def _answer(self, method):
+            for m, pattern, data in messages:
+                for prefix in ("https://api.camptocamp.org", "https://forum.camptocamp.org"):
+                    if m == method and not isinstance(data, Exception) and re.fullmatch(pattern, prefix + self.path):
+                        json_data = isinstance(data, dict)
+                        body = json.dumps(data).encode("utf-8") if json_data else data.encode("utf-8")
+                        self.send_response(200)
+                        self.send_header("Content-Type", "application/json" if json_data else "text/plain")
+                        self.send_header("Content-Length", str(len(body)))
+                        self.end_headers()
+                        self.wfile.write(body)
+                        return
+
+            self.send_error(404)
+
+        def do_GET(self):
+            self._answer("GET")
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self._answer("POST")
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    yield "http://127.0.0.1:{}".format(server.server_port)
+
+    server.shutdown()
+    server.server_close()
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_bot(local_server):
+    from campbot import objects
+    from campbot.aio import AsyncCampBot
+
+    async def scenario():
+        async with AsyncCampBot(min_delay=0.001, wiki_url=local_server, forum_url=local_server) as bot:
+            await bot.login("x", "y")
+
+            route = await bot.wiki.get_route(293549)
+            assert isinstance(route, objects.Route)
+            assert route.get_url() == "http://127.0.0.1:{}/routes/293549".format(local_server.split(":")[-1])
+
+            version = await bot.wiki.get_wiki_object_version(293549, "r", "fr", 1738922)
+            assert isinstance(version, objects.Version)
+            assert await bot.wiki.get_wiki_object_version(293549, "r", "fr", None) is None
+
+            routes = [doc async for doc in bot.wiki.get_documents({}, constructor=objects.Route)]
+            assert len(routes) == 30
+
+            contributions = [c async for c in bot.wiki.get_contributions(oldest_date="2017-12-12",
+                                                                         newest_date="2017-12-21")]
+            assert all(isinstance(c, objects.Contribution) for c in contributions)
+
+            user = await bot.wiki.get_user(forum_name="CharlesB")
+            assert isinstance(user, objects.WikiUser)
+
+            post = await bot.forum.get_post(url=local_server + "/t/topoguide-verifications-automatiques/201480/1")
+            assert isinstance(post, objects.Post)
+
+            await bot.forum.get_group_members("Association")
+            await bot.forum.get_participants(local_server + "/t/topoguide-verifications-automatiques/201480")
+            await bot.forum.post_message("coucou", local_server + "/t/topoguide-verifications-automatiques/201480")
+
+            with pytest.raises(aiohttp.ClientResponseError):
+                await bot.wiki.get("/unknown")
+
+    run(scenario())
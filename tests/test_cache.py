@@ -0,0 +1,245 @@
+# coding: utf-8
+
+from __future__ import print_function, unicode_literals, division
+
+from tests.fixtures import FakeResponse, fix_requests, local_server, get_local_bot, Spy
+
+
+def test_response_cache(tmpdir):
+    from campbot import CampBot
+
+    bot = CampBot(min_delay=0, cache_dir=str(tmpdir))
+    cache = bot.wiki.response_cache
+
+    requests = []
+
+    def request(method, url, headers={}, **kwargs):
+        requests.append((url, headers))
+
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+
+        return FakeResponse(200, {"document_id": 123}, headers={"ETag": '"v1"'})
+
+    bot.wiki._session.request = request
+
+    assert bot.wiki.get("/routes/123") == {"document_id": 123}
+    assert bot.wiki.get("/routes/123") == {"document_id": 123}
+    assert requests[1][1] == {"If-None-Match": '"v1"'}
+    assert cache.stats == {"fresh": 0, "revalidated": 1, "downloaded": 1}
+
+    # parameters are part of the key, and some URLs are never cached
+    bot.wiki.get("/routes/123", lang="fr")
+    bot.wiki.get("/documents/changes")
+    bot.wiki.get("/documents/changes")
+    assert [headers for _, headers in requests[2:]] == [{}, {}, {}]
+
+    # cache is persistent
+    bot = CampBot(min_delay=0, cache_dir=str(tmpdir))
+    bot.wiki._session.request = request
+    bot.wiki.get("/routes/123")
+    assert requests[-1][1] == {"If-None-Match": '"v1"'}
+
+    # saving a document invalidates it
+    bot.wiki.put("/routes/123", {})
+    bot.wiki.get("/routes/123")
+    assert requests[-1][1] == {}
+
+
+def test_response_cache_ttl(tmpdir):
+    from campbot.cache import ResponseCache
+
+    cache = ResponseCache(str(tmpdir.join("responses.db")), rules=[(r"^/routes", 3600), (r"^/waypoints", 0)])
+
+    assert cache.get_ttl("/routes/123") == 3600
+    assert cache.get_ttl("/areas/123") is None
+
+    cache.store("/routes/123", {}, FakeResponse(200, {"document_id": 123}))
+    cache.store("/waypoints/123", {}, FakeResponse(200, {"document_id": 123}))  # no validator
+    cache.store("/areas/123", {}, FakeResponse(200, {"document_id": 123}))
+
+    assert cache.lookup("/routes/123", {}).is_fresh()
+    assert cache.lookup("/routes/123", {"pl": "fr"}) is None
+    assert cache.lookup("/waypoints/123", {}) is None
+    assert cache.lookup("/areas/123", {}) is None
+
+
+def test_version_store(tmpdir, fix_requests):
+    from campbot import CampBot
+
+    bot = CampBot(cache_dir=str(tmpdir))
+    store = bot.wiki.version_store
+
+    version = bot.wiki.get_wiki_object_version(293549, "r", "fr", 1738922)
+    assert store.stats == {"hits": 0, "misses": 1}
+
+    bot = CampBot(cache_dir=str(tmpdir))
+    bot.wiki.get = None  # no request allowed
+    assert bot.wiki.get_wiki_object_version(293549, "r", "fr", 1738922) == version
+    assert bot.wiki.version_store.stats == {"hits": 1, "misses": 0}
+
+    # same content is stored once
+    store.put(293549, "fr", 1738928, store.get(293549, "fr", 1738922))
+    assert store._execute("SELECT COUNT(*) FROM content") == [(1,)]
+
+
+def test_lru_cache():
+    from campbot.cache import LruCache
+
+    cache = LruCache(max_entries=3, max_bytes=100)
+
+    for i in range(3):
+        cache.put(i, "value", 10)
+
+    assert cache.get(0) == "value"
+    cache.put(3, "value", 10)  # 1 is least recently used
+    assert cache.peek(1) is None
+    assert cache.get(0) == "value"
+
+    cache.put(4, "big", 85)
+    assert len(cache) == 2
+    assert cache.size == 95
+
+    cache.put(5, "too big", 101)
+    assert cache.peek(5) is None
+
+    cache.invalidate(4)
+    assert cache.size == 10
+    assert cache.stats == {"hits": 2, "misses": 0, "evictions": 3}
+
+
+def test_object_cache(fix_requests):
+    from campbot import CampBot
+
+    bot = CampBot()
+    cache = bot.wiki.object_cache
+
+    route = bot.wiki.get_route(293549)
+    route.document_id = 1
+    assert bot.wiki.get_route(293549).document_id == 293549
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+    # contributions with a newer version invalidate cache
+    list(bot.wiki.get_contributions(oldest_date="2017-12-12", newest_date="2017-12-13"))
+    assert cache.peek("/routes/293549") is None
+
+    bot.wiki.get_route(293549)
+    bot.wiki.put("/routes/293549", {})
+    assert cache.peek("/routes/293549") is None
+
+
+def test_user_status(tmpdir, fix_requests):
+    from campbot import CampBot
+
+    bot = CampBot(min_delay=0, cache_dir=str(tmpdir))
+    store = bot.wiki.user_status
+
+    bot.wiki.prefetch_user_status([3199, 3199, 1, 3199])
+    assert store.stats == {"hits": 0, "misses": 2}
+    assert bot.metrics._endpoints["wiki", "GET", "/documents/changes"].count == 2
+
+    assert bot.wiki.is_newbie(3199)
+    assert bot.metrics._endpoints["wiki", "GET", "/documents/changes"].count == 2
+
+    # newbie status expires, other one is permanent
+    store.put(2, False)
+    store._execute("UPDATE user_status SET checked_at=0")
+    assert store.get(3199) is None
+    assert store.get(2) is False
+
+    bot = CampBot(min_delay=0, cache_dir=str(tmpdir))
+    bot.wiki.get = None  # no request allowed
+    assert bot.wiki.is_newbie(2) is False
+
+
+def test_check_results_cache(local_server, tmpdir):
+    from campbot.checkers import DocumentReport, LengthTest, NewbieTest, ReTest
+
+    calls = []
+
+    re_test = ReTest("Test", "fr")
+    re_test.patterns.append("Description")
+    tests = [Spy(LengthTest("fr"), calls), Spy(NewbieTest(), calls), Spy(re_test, calls)]
+
+    bot = get_local_bot(local_server, cache_dir=str(tmpdir))
+    contributions = [c for c in bot.wiki.get_contributions(oldest_date="2017-01-01", newest_date="2020-01-01")
+                     if c.document.document_id == 100001]
+
+    report = DocumentReport(bot, contributions, tests)
+    assert calls == ["LengthTest", "NewbieTest", "ReTest"] * 2
+
+    # stored results are used by next runs
+    del calls[:]
+    bot = get_local_bot(local_server, cache_dir=str(tmpdir))
+    cached = DocumentReport(bot, contributions, tests)
+    assert calls == ["NewbieTest"] * 2
+    assert [r.emojis for r in cached.sub_reports] == [r.emojis for r in report.sub_reports]
+
+    # but not with a new configuration
+    del calls[:]
+    re_test.patterns.append("Other")
+    DocumentReport(bot, contributions, tests)
+    assert calls == ["NewbieTest", "ReTest"] * 2
+
+
+def test_contributions_cursor(local_server, tmpdir):
+    from campbot.cache import ContributionCursor
+
+    bot = get_local_bot(local_server)
+    filename = str(tmpdir.join("cursor.json"))
+    expected = [c.version_id for c in bot.wiki.get_contributions(oldest_date="2017-01-01")]
+
+    # interrupted walk
+    contributions = bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=ContributionCursor(filename))
+    seen = [next(contributions).version_id for _ in range(70)]
+    contributions.close()
+
+    cursor = ContributionCursor(filename)
+    assert cursor.last_version_id == seen[-2]  # last one is not marked as consumed
+    assert cursor.newest_version_id == expected[0]
+    assert not cursor.done
+
+    seen += [c.version_id for c in bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor)]
+    assert seen[:70] + seen[71:] == expected
+    assert ContributionCursor(filename).done
+    assert list(bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor)) == []
+
+    # forward walk, only new contributions
+    route = bot.wiki.get_route(100001)
+    route.locales[0].description = "New"
+    route.save("Test", ask_before_saving=False)
+
+    new = list(bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor, forward=True))
+    assert [c.document.document_id for c in new] == [100001]
+    assert ContributionCursor(filename).newest_version_id == new[0].version_id
+    assert list(bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor, forward=True)) == []
+
+
+def test_contributions_cursor_without_autosave(local_server, tmpdir):
+    from campbot.cache import ContributionCursor
+
+    bot = get_local_bot(local_server)
+    filename = str(tmpdir.join("cursor.json"))
+    expected = [c.version_id for c in bot.wiki.get_contributions(oldest_date="2017-01-01")]
+
+    # caller saves cursor each 50 contributions, walk is interrupted before next save
+    cursor = ContributionCursor(filename, autosave=False)
+    contributions = bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor)
+    for i, contrib in enumerate(contributions):
+        if i == 50:
+            cursor.save()
+        elif i == 70:
+            break
+    contributions.close()
+
+    cursor = ContributionCursor(filename, autosave=False)
+    assert cursor.newest_version_id == expected[0]
+    assert cursor.last_version_id == expected[49]
+
+    seen = [c.version_id for c in bot.wiki.get_contributions(oldest_date="2017-01-01", cursor=cursor)]
+    cursor.save()
+    assert seen == expected[50:]
+
+    cursor = ContributionCursor(filename)
+    assert cursor.done
+    assert cursor.newest_version_id == expected[0]
@@ -0,0 +1,110 @@
+# coding: utf-8
+
+from __future__ import print_function, unicode_literals, division
+
+import json
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+
+class FakeAdapter(BaseAdapter):
+    def __init__(self):
+        super(FakeAdapter, self).__init__()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        self.requests.append(request)
+
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        data = {"url": request.url, "count": len(self.requests)}
+
+        if "/session/sso_login?" in request.url:
+            data.pop("url")
+
+        if request.url.endswith("/users/login"):
+            data["token"] = "secret-jwt"
+            data["redirect_internal"] = "https://forum.camptocamp.org/session/sso_login?sso=secret-nonce&sig=secret"
+            response.headers["set-cookie"] = "session=secret-cookie"
+
+        response._content = json.dumps(data).encode("utf-8")
+        response.url = request.url
+        response.request = request
+
+        return response
+
+    def close(self):
+        pass
+
+
+def test_record_and_replay(tmpdir):
+    from campbot import CampBot
+    from campbot.cassette import RecordingAdapter, ReplayAdapter, CassetteMiss
+
+    filename = str(tmpdir.join("cassette.jsonl.gz"))
+    recorder = RecordingAdapter(filename, adapter=FakeAdapter())
+
+    bot = CampBot(min_delay=0)
+    bot.wiki._session.mount("https://", recorder)
+    bot.forum._session.mount("https://", recorder)
+
+    recorded = [bot.wiki.get("/routes/123"), bot.wiki.get("/routes/123"),
+                bot.wiki.get("/waypoints", pl="fr"), bot.forum.get("/t/123.json")]
+    assert recorded[0]["count"] == 1
+    assert recorded[1]["count"] == 2
+
+    bot.close()
+
+    bot = CampBot(replay=filename)
+    assert bot.wiki.min_delay.total_seconds() == 0
+
+    replayed = [bot.wiki.get("/routes/123"), bot.wiki.get("/routes/123"),
+                bot.wiki.get("/waypoints", pl="fr"), bot.forum.get("/t/123.json")]
+    assert replayed == recorded
+
+    # last recorded response is repeated
+    assert bot.wiki.get("/routes/123")["count"] == 2
+
+    with pytest.raises(CassetteMiss):
+        bot.wiki.get("/routes/456")
+
+    sleeps = []
+    adapter = ReplayAdapter(filename, latency_factor=2, sleep=sleeps.append)
+    assert len(adapter) == 4
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    assert session.get("https://forum.camptocamp.org/t/123.json").json()["count"] == 4
+    assert len(sleeps) == 1
+
+
+def test_secrets_are_not_recorded(tmpdir):
+    import gzip
+    from campbot import CampBot
+    from campbot.cassette import RecordingAdapter, ReplayAdapter
+
+    filename = str(tmpdir.join("cassette.jsonl.gz"))
+
+    bot = CampBot(min_delay=0)
+    recorder = RecordingAdapter(filename, adapter=FakeAdapter())
+    bot.wiki._session.mount("https://", recorder)
+    bot.forum._session.mount("https://", recorder)
+    res = bot.wiki.post("/users/login", {"username": "bot", "password": "secret-password"})
+    assert res["token"] == "secret-jwt"
+    bot.forum.get(res["redirect_internal"].replace(bot.forum.api_url, ""))
+    bot.close()
+
+    with gzip.open(filename, "rb") as f:
+        content = f.read().decode("utf-8")
+
+    assert "secret" not in content
+
+    # same redaction is used to match requests
+    bot = CampBot(replay=filename, replay_latency=2)
+    res = bot.wiki.post("/users/login", {"username": "bot", "password": "other"})
+    assert res["token"] == "redacted"
+    assert bot.forum.get("/session/sso_login?sso=other-nonce&sig=other")["count"] == 2
+    assert bot.wiki._session.get_adapter("https://").latency_factor == 2
@@ -0,0 +1,60 @@
+# coding: utf-8
+
+from __future__ import print_function, unicode_literals, division
+
+from tests.fixtures import fix_requests
+
+
+def test_endpoint_template():
+    from campbot.metrics import get_endpoint_template
+
+    assert get_endpoint_template("/routes/123") == "/routes/{id}"
+    assert get_endpoint_template("/routes?offset=30&a=14274") == "/routes"
+    assert get_endpoint_template("/routes/123/fr/456") == "/routes/{id}/{lang}/{id}"
+    assert get_endpoint_template("/t/topic/123/4") == "/t/topic/{id}/{id}"
+    assert get_endpoint_template("/posts/123.json") == "/posts/{id}.json"
+
+
+def test_metrics():
+    from campbot.metrics import Metrics
+
+    metrics = Metrics()
+    metrics.observe_request("wiki", "GET", "/routes/1", 200, 0.2, 1024)
+    metrics.observe_request("wiki", "GET", "/routes/2?pl=fr", 404, 3, 0)
+    metrics.observe_sleep("wiki", 1.5)
+
+    text = metrics.to_prometheus()
+
+    assert 'campbot_requests_total{bot="wiki",endpoint="/routes/{id}",method="GET",status="200"} 1' in text
+    assert 'campbot_requests_total{bot="wiki",endpoint="/routes/{id}",method="GET",status="404"} 1' in text
+    assert 'campbot_response_bytes_total{bot="wiki",endpoint="/routes/{id}",method="GET"} 1024' in text
+    assert 'campbot_request_duration_seconds_bucket{bot="wiki",endpoint="/routes/{id}",le="0.25",method="GET"} 1' in text
+    assert 'campbot_request_duration_seconds_bucket{bot="wiki",endpoint="/routes/{id}",le="+Inf",method="GET"} 2' in text
+    assert 'campbot_request_duration_seconds_count{bot="wiki",endpoint="/routes/{id}",method="GET"} 2' in text
+    assert 'campbot_rate_limiter_sleep_seconds_total{bot="wiki"} 1.5' in text
+
+    summary = metrics.get_summary().split("\n")
+
+    assert summary[0] == ("wiki GET /routes/{id} : 2 requests, 1 errors, 1.0 kB, "
+                          "mean 1.600 s, max 3.000 s, total 3.2 s, decoding 0.000 s")
+    assert summary[1] == "wiki rate limiter : 1.5 s waiting"
+
+
+def test_bot_metrics(fix_requests, tmpdir):
+    from campbot import CampBot
+    from campbot.__main__ import main
+    from tests.test_miscs import get_main_args
+
+    bot = CampBot()
+    bot.wiki.get_route(route_id=293549)
+    bot.forum.get_group_members(group_name="Association")
+
+    text = bot.metrics.to_prometheus()
+    assert 'campbot_requests_total{bot="wiki",endpoint="/routes/{id}",method="GET",status="200"} 1' in text
+    assert 'bot="forum",endpoint="/groups/Association/members.json"' in text
+
+    filename = str(tmpdir.join("metrics.prom"))
+    main(get_main_args("export", {"--metrics": filename, "--out": str(tmpdir.join("out.csv"))}))
+
+    with open(filename) as f:
+        assert "campbot_requests_total" in f.read()
@@ -2,7 +2,8 @@
 
 from __future__ import print_function, unicode_literals, division
 
-from tests.fixtures import fix_requests, fix_dump, ids_files, fix_input
+from tests.fixtures import fix_requests, fix_dump, ids_files, fix_input, local_server, get_local_bot, Spy
+import logging
 import os
 import pytest
 
@@ -61,6 +62,24 @@ def test_main_entry_point(fix_requests, ids_files):
     os.remove("contributions.csv")
 
 
+def test_main_interrupted(fix_requests, tmpdir, monkeypatch):
+    from campbot import checkers
+    from campbot.__main__ import main
+
+    def watch_recent_changes(bot, **kwargs):
+        bot.wiki.get("/documents/changes?limit=1")
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(checkers, "watch_recent_changes", watch_recent_changes)
+    filename = str(tmpdir.join("metrics.prom"))
+
+    with pytest.raises(KeyboardInterrupt):
+        main(get_main_args("watch", {"--metrics": filename}))
+
+    # metrics are written when watch is stopped
+    assert "/documents/changes" in tmpdir.join("metrics.prom").read()
+
+
 def test_forum(fix_requests):
     from campbot import CampBot
 
@@ -206,6 +225,7 @@ def get_main_args(action, others=None):
     # noinspection PyDictCreation
     result = {
         "check_rc": False,
+        "watch": False,
         "check_voters": False,
         "contribs": False,
         "export": False,
@@ -223,6 +243,14 @@ def get_main_args(action, others=None):
         "--ends": "2999-12-31",
         "--starts": "2017-06-01",
         "--out": "",
+        "--cache": None,
+        "--workers": None,
+        "--metrics": None,
+        "--record": None,
+        "--replay": None,
+        "--replay-latency": None,
+        "--interval": None,
+        "--cursor": None,
     }
 
     if others:
@@ -265,6 +293,48 @@ def test_checkers(fix_requests):
     t(None, contrib, contrib)
 
 
+def test_document_report(local_server):
+    from campbot.checkers import DocumentReport
+
+    bot = get_local_bot(local_server)
+
+    contributions = [c for c in bot.wiki.get_contributions(oldest_date="2017-01-01", newest_date="2020-01-01")
+                     if c.document.document_id == 100001]
+    assert len(contributions) == 2
+
+    report = DocumentReport(bot, contributions, [])
+    assert report.sub_reports[0].old is report.sub_reports[1].new
+    assert report.sub_reports[1].old is None
+
+    # each version is fetched once
+    assert bot.metrics._endpoints["wiki", "GET", "/routes/{id}/{lang}/{id}"].count == 2
+
+
+def test_diff_scoped_tests(local_server):
+    from campbot.checkers import DocumentReport, LengthTest, DistanceTest, NewbieTest, get_changed_fields
+
+    bot = get_local_bot(local_server)
+
+    route = bot.wiki.get_route(100001)
+    route.locales[0].description = "New"
+    route.save("Test", ask_before_saving=False)
+
+    contributions = [c for c in bot.wiki.get_contributions(oldest_date="2017-01-01", newest_date="2999-01-01")
+                     if c.document.document_id == 100001]
+
+    report = DocumentReport(bot, contributions, [])
+    newest, first = report.sub_reports[0], report.sub_reports[-1]
+    assert get_changed_fields(newest.old, newest.new) == {"locales.description"}
+    assert get_changed_fields(first.old, first.new) is None
+
+    calls = []
+    DocumentReport(bot, contributions[:1], [Spy(LengthTest("fr"), calls), Spy(DistanceTest(), calls),
+                                            Spy(NewbieTest(), calls)])
+
+    # only description is modified, geometry is not tested
+    assert calls == ["LengthTest", "NewbieTest"]
+
+
 def test_weird(fix_requests, fix_input):
     from campbot import CampBot, __main__
     import os
@@ -314,3 +384,260 @@ def test_get_closest_documents(fix_requests):
     bot = CampBot()
 
     bot.find_closest_documents(objects.Waypoint, 289284, 6175526, 2000)
+
+
+def test_ordered_map():
+    from campbot import utils
+    import time
+
+    def slow_square(x):
+        time.sleep(0.01 * (x % 3))
+        return x * x
+
+    items = [1, 2, 3, 2, 4, 5, 1, 6]
+
+    assert list(utils.ordered_map(slow_square, items)) == [x * x for x in items]
+    assert list(utils.ordered_map(slow_square, items, workers=4)) == [x * x for x in items]
+    assert list(utils.ordered_map(slow_square, items, workers=4, key=lambda x: x)) == [1, 4, 9, 16, 25, 36]
+
+    def fail(x):
+        raise ValueError(x)
+
+    with pytest.raises(ValueError):
+        list(utils.ordered_map(fail, items, workers=4))
+
+
+def test_concurrent_documents(fix_requests, ids_files):
+    from campbot import CampBot
+
+    bot = CampBot(workers=4)
+
+    assert len(list(bot.wiki.get_routes({}))) == 30
+    assert len(list(bot.get_documents(ids_files))) == 2
+
+
+def test_single_flight(fix_requests):
+    from campbot import CampBot, utils
+    import threading
+    import time
+
+    flight = utils.SingleFlight()
+    calls = []
+
+    def slow(x):
+        calls.append(x)
+        time.sleep(0.05)
+        return x * 2
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow, 21))) for _ in range(5)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert flight.shared == 4
+
+    # next call is not collapsed
+    assert flight.do("key", slow, 1) == 2
+
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+
+    bot = CampBot(workers=4)
+    documents = list(utils.ordered_map(lambda _: bot.wiki.get_route(293549), range(8), workers=4))
+    documents[0].document_id = 1
+    assert documents[1].document_id == 293549
+
+
+def test_json_decoding(fix_requests):
+    from campbot import CampBot, utils
+
+    content = b' { "documents" : [ {"a": [1, "]"]}, null, 3 ], "total": 3 }'
+
+    assert utils.json_loads(content) == {"documents": [{"a": [1, "]"]}, None, 3], "total": 3}
+
+    bot = CampBot()
+    assert len(list(bot.wiki.get_documents_raw("routes"))) == 30
+    assert "campbot_json_decode_seconds_total{" in bot.metrics.to_prometheus()
+
+
+def test_parse_datetime():
+    from campbot import utils
+    from dateutil import parser
+
+    for value in ("2017-12-20T21:49:41.363647+00:00", "2018-05-12", "2017-12-20T21:49:41Z", "12 may 2018"):
+        assert utils.parse_datetime(value) == parser.parse(value)
+
+
+def test_progress(caplog):
+    from campbot.utils import Progress
+
+    now = [0]
+    progress = Progress("Test", 4, interval=10, clock=lambda: now[0])
+    assert progress.get_eta() is None
+
+    with caplog.at_level(logging.INFO):
+        for _ in range(3):
+            now[0] += 3
+            progress.update()
+
+        assert progress.get_eta() == 3
+        now[0] += 3
+        progress.update()
+
+    assert [r.getMessage() for r in caplog.records] == ["Test : 1/4, 0:00:09 remaining",
+                                                        "Test : 4/4, 0:00:00 remaining"]
+
+
+def test_pattern_set():
+    from campbot.utils import PatternSet
+
+    pattern_set = PatternSet([["(?i)abc", "x+y"], ["foo", "bar"], [r"(a)\1"]])
+    assert pattern_set._any is None  # back reference can't be combined
+    assert pattern_set.search("ABC bar") == {0, 1}
+    assert pattern_set.search("aa") == {2}
+
+    pattern_set = PatternSet([["(?i)abc", "x+y"], ["foo", "bar"]])
+    assert pattern_set._any.pattern == "(?i:abc)|(?:x+y)|(?:foo)|(?:bar)"
+    assert pattern_set.search("xxy") == {0}
+    assert pattern_set.search("nothing") == set()
+    assert "xxy" in pattern_set._memo
+
+
+def test_lazy_documents(local_server):
+    from campbot import objects
+
+    bot = get_local_bot(local_server)
+
+    def get_count():
+        stats = bot.metrics._endpoints.get(("wiki", "GET", "/routes/{id}"))
+        return stats.count if stats else 0
+
+    routes = list(bot.wiki.get_documents(constructor=objects.Route, lazy=True))
+    assert len(routes) == 35
+    assert get_count() == 0
+
+    route = routes[0]
+    locale = route.get_locale("fr")
+    assert route.is_partial()
+    assert route.get_title("fr") == "Summit : Document {}".format(route.document_id)
+    assert route.activities == ["rock_climbing"]
+    assert "geom" in route.geometry
+    assert get_count() == 0
+
+    locale.title = "New title"
+    assert locale.description.startswith("Description")  # missing in list item
+    assert get_count() == 1
+    assert not route.is_partial()
+    assert route.get_locale("fr") is locale
+    assert locale.title == "New title"
+    assert route.associations == {"images": [], "waypoints": [], "routes": []}
+
+    # missing fields fetch full document, and are still missing after
+    route = routes[2]
+    assert not hasattr(route, "foo")
+    assert route.get("foo", 42) == 42
+    assert get_count() == 2
+    assert "associations" in routes[3]
+    assert routes[4].get("associations") is not None
+    assert get_count() == 4
+
+    route = routes[1]
+    route["elevation_max"] = 1234
+    route.save("Test", ask_before_saving=False)
+    assert get_count() == 5
+
+    saved = bot.wiki.get_route(route.document_id)
+    assert saved.elevation_max == 1234
+    assert saved.get_locale("fr").description.startswith("Description")
+
+
+def test_contributions_prefetch(local_server):
+    bot = get_local_bot(local_server)
+
+    def get_count():
+        return bot.metrics._endpoints["wiki", "GET", "/documents/changes"].count
+
+    contributions = bot.wiki.get_contributions(oldest_date="2018-01-01T01:40:00", newest_date="2020-01-01")
+    assert len(list(contributions)) == 40
+    assert get_count() == 1  # next page is not needed
+
+    contributions = bot.wiki.get_contributions(oldest_date="2017-01-01", newest_date="2020-01-01")
+    next(contributions)
+    assert len(list(contributions)) == 144
+    assert get_count() == 1 + 3
+
+
+def test_watch_recent_changes(local_server, tmpdir, monkeypatch):
+    from campbot import checkers
+
+    bot = get_local_bot(local_server)
+    filename = str(tmpdir.join("cursor.json"))
+    fixed, sleeps = [], []
+
+    monkeypatch.setattr(checkers, "get_automatic_replacments", lambda bot: [])
+    monkeypatch.setattr(bot, "fix_recent_changes", lambda *args, **kwargs: fixed.append(kwargs["contributions"]))
+
+    def get_count():
+        return sum(stats.count for key, stats in bot.metrics._endpoints.items() if key[2] == "/documents/changes")
+
+    # first run starts from now
+    checkers.watch_recent_changes(bot, 60, False, filename, polls=1, sleep=sleeps.append)
+    assert fixed == []
+    assert get_count() == 2
+
+    route = bot.wiki.get_route(100001)
+    route.locales[0].description = "New"
+    route.save("Test", ask_before_saving=False)
+
+    metrics_filename = str(tmpdir.join("metrics.prom"))
+    checkers.watch_recent_changes(bot, 60, False, filename, polls=3, sleep=sleeps.append,
+                                  metrics_filename=metrics_filename)
+    assert [[c.document.document_id for c in contributions] for contributions in fixed] == [[100001]]
+    assert sleeps == [60, 60]
+    assert get_count() == 2 + 3 + 1  # one request per poll, and newbie status of contributor
+    assert "/documents/changes" in tmpdir.join("metrics.prom").read()
+
+    # report is posted in local forum topic
+    posts = local_server.data.topics[201480]
+    assert len(posts) == 2
+    assert "[Explications]({}/t/".format(local_server.url) in local_server.data.posts[posts[1]]["raw"]
+
+
+def test_watch_failed_poll(local_server, tmpdir, monkeypatch):
+    from campbot import checkers
+    from campbot.cache import ContributionCursor
+
+    bot = get_local_bot(local_server)
+    filename = str(tmpdir.join("cursor.json"))
+    fixed = []
+
+    def fix_recent_changes(*args, **kwargs):
+        fixed.append([c.version_id for c in kwargs["contributions"]])
+
+        if len(fixed) == 1:
+            raise ValueError("Failure")
+
+    monkeypatch.setattr(checkers, "get_automatic_replacments", lambda bot: [])
+    monkeypatch.setattr(bot, "fix_recent_changes", fix_recent_changes)
+
+    checkers.watch_recent_changes(bot, 60, False, filename, polls=1, sleep=lambda delay: None)
+    newest_version_id = ContributionCursor(filename).newest_version_id
+
+    route = bot.wiki.get_route(100001)
+    route.locales[0].description = "New"
+    route.save("Test", ask_before_saving=False)
+
+    # first poll fails, and second one processes the same contribution
+    checkers.watch_recent_changes(bot, 60, False, filename, polls=2, sleep=lambda delay: None)
+    assert len(fixed) == 2
+    assert fixed[0] == fixed[1]
+    assert ContributionCursor(filename).newest_version_id == fixed[0][0] > newest_version_id
@@ -0,0 +1,133 @@
+# coding: utf-8
+
+from __future__ import print_function, unicode_literals, division
+
+import os
+
+from tests.fixtures import fix_dump, fix_requests, local_server, get_local_bot
+
+
+def test_documents(local_server):
+    bot = get_local_bot(local_server)
+
+    routes = list(bot.wiki.get_documents_raw("routes"))
+    assert len(routes) == 35
+    assert len(set(route["document_id"] for route in routes)) == 35
+
+    route = bot.wiki.get_route(routes[0]["document_id"])
+    assert route.version == 2
+    assert route.get_title("fr") == "Summit : Document {}".format(route.document_id)
+
+    route.locales[0].description = "New"
+    route.save("Test", ask_before_saving=False)
+    assert bot.wiki.get_route(route.document_id).version == 3
+
+    bot.login("login", "password")
+    assert bot.forum.get_group_members("Association") == []
+
+    documents, total = local_server.data.get_documents("r", offset=30, limit=10)
+    assert total == 35
+    assert [d["document_id"] for d in documents] == [route["document_id"] for route in routes[30:]]
+
+
+def test_contributions(local_server):
+    bot = get_local_bot(local_server)
+
+    contributions = list(bot.wiki.get_contributions(oldest_date="2017-01-01", newest_date="2020-01-01"))
+    assert len(contributions) == 5 + 70 * 2
+    assert [c.version_id for c in contributions] == sorted((c.version_id for c in contributions), reverse=True)
+
+    contribution = contributions[0]
+    version = bot.wiki.get_wiki_object_version(contribution.document.document_id, contribution.document.type,
+                                               contribution.lang, contribution.version_id)
+    assert version.next_version_id is None
+    assert version.previous_version_id is not None
+
+    user_contributions = list(bot.wiki.get_contributions(oldest_date="2017-01-01", user_id=1))
+    assert set(c.user.user_id for c in user_contributions) == {1}
+
+
+def test_throttling():
+    from campbot.server import LocalServer, ServerData
+
+    with LocalServer(ServerData.synthetic(documents=4), rate=1000, burst=2) as server:
+        bot = get_local_bot(server)
+        bot.wiki.max_throttled_retries = 50
+
+        for document_id in range(100000, 100004):
+            bot.wiki.get_wiki_object(document_id, "r" if document_id % 2 else "w")
+
+        assert server.stats["throttled"] == server.stats["requests"] - 4
+
+
+def test_from_dump(fix_dump, fix_requests):
+    from campbot import CampBot
+    from campbot.dump import Dump
+    from campbot.server import ServerData
+
+    dump = Dump()
+    contribution = next(CampBot().wiki.get_contributions(oldest_date="2017-01-01"))
+
+    cur = dump._conn.cursor()
+    dump.insert(cur, contrib=contribution)
+    dump._conn.commit()
+    dump.complete_contributions()
+
+    data = ServerData.from_dump("test.db")
+    dump._conn.close()
+    os.remove("test.db")
+    route = data.get_document(293549)
+
+    assert route["type"] == "r"
+    assert [l["title"] for l in route["locales"] if l["lang"] == "fr"] == ["Voie Cerdà Albert"]
+    assert route["rock_types"] == "calcaire"
+    assert data.get_document(952999)["type"] == "w"
+    assert data.get_feed(50)["feed"][0]["version_id"] == 1738923
+
+
+def test_documents_prefetch():
+    from campbot.server import LocalServer, ServerData
+
+    with LocalServer(ServerData.synthetic(documents=700, versions=1, users=1)) as server:
+        bot = get_local_bot(server, workers=3)
+
+        routes = list(bot.wiki.get_documents_raw("routes"))
+        assert [route["document_id"] for route in routes] == list(range(100001, 100700, 2))
+
+        # 4 pages of 100, no request for an empty page
+        assert bot.metrics._endpoints["wiki", "GET", "/routes"].count == 4
+
+        bot.wiki.page_size = 50
+        assert len(list(bot.wiki.get_documents_raw("routes", {"limit": 30}))) == 350
+        assert bot.metrics._endpoints["wiki", "GET", "/routes"].count == 4 + 12
+
+        # API lowers limits above 100, list does not end on first page
+        routes = list(bot.wiki.get_documents_raw("routes", {"limit": 200}))
+        assert [route["document_id"] for route in routes] == list(range(100001, 100700, 2))
+
+        bot.wiki.page_size = 150
+        assert len(list(bot.wiki.get_documents_raw("routes"))) == 350
+
+
+def test_documents_tiled():
+    from campbot.server import LocalServer, ServerData
+
+    with LocalServer(ServerData.synthetic(documents=1000, versions=1, users=1)) as server:
+        bot = get_local_bot(server, workers=4)
+
+        routes = list(bot.wiki.get_documents_raw_tiled("routes", max_total=60))
+        assert sorted(route["document_id"] for route in routes) == list(range(100001, 101000, 2))
+
+        bbox = "600000%2C5500000%2C800000%2C5800000"
+        routes = list(bot.wiki.get_documents_raw_tiled("routes", {"bbox": bbox}, max_total=60))
+        expected = list(bot.wiki.get_documents_raw("routes", {"bbox": bbox.replace("%2C", ",")}))
+
+        assert 0 < len(routes) < 500
+        assert sorted(route["document_id"] for route in routes) == sorted(doc["document_id"] for doc in expected)
+
+
+def test_split_bbox():
+    from campbot.core import _parse_bbox, _split_bbox
+
+    assert _parse_bbox("1%252C2%252C3%252C4") == (1, 2, 3, 4)
+    assert _split_bbox((0, 0, 10, 20)) == [(0, 0, 5, 10), (5, 0, 10, 10), (0, 10, 5, 20), (5, 10, 10, 20)]
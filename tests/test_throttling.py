@@ -0,0 +1,192 @@
+# coding: utf-8
+
+from __future__ import print_function, unicode_literals, division
+
+import pytest
+
+from tests.fixtures import fix_requests, FakeClock, FakeResponse
+
+
+def test_token_bucket():
+    from campbot.throttling import TokenBucket
+
+    clock = FakeClock()
+    bucket = TokenBucket(rate=0.5, burst=3, clock=clock, sleep=clock.sleep)
+
+    # burst is sent without waiting
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+
+    # then one request every 2 seconds
+    assert bucket.acquire() == pytest.approx(2)
+    assert bucket.acquire() == pytest.approx(2)
+
+    # idle time refills the bucket, up to burst
+    clock.now += 100
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.acquire() == pytest.approx(2)
+
+    bucket.rate = 1
+    assert bucket.acquire() == pytest.approx(1)
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, burst=0)
+
+    unlimited = TokenBucket(rate=float("inf"))
+    assert [unlimited.reserve() for _ in range(10)] == [0] * 10
+
+
+def test_shared_rate_limiter(fix_requests):
+    from campbot import CampBot
+    from campbot.throttling import TokenBucket
+
+    bucket = TokenBucket(rate=1000, burst=10)
+    bot = CampBot(rate_limiter=bucket)
+
+    assert bot.wiki.rate_limiter is bucket
+    assert bot.forum.rate_limiter is bucket
+
+    bot = CampBot(min_delay=0)
+    assert bot.wiki.rate_limiter is not bot.forum.rate_limiter
+    assert bot.wiki.rate_limiter.rate == float("inf")
+
+    bot.wiki.get_route(123)
+
+
+def test_adaptive_rate_limiter():
+    from campbot.throttling import AdaptiveRateLimiter, parse_retry_after
+
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(rate=10, burst=1, increase=1, latency_threshold=1, clock=clock, sleep=clock.sleep)
+
+    assert limiter.on_response(429, 0.1) is True
+    assert limiter.rate == 5
+    assert limiter.on_response(500, 0.1) is False
+    assert limiter.rate == 2.5
+
+    assert limiter.on_response(200, 0.1) is False
+    assert limiter.rate == 3.5
+
+    # slow responses freeze the rate
+    limiter.on_response(200, 5)
+    assert limiter.rate == 3.5
+
+    for _ in range(20):
+        limiter.on_response(200, 0.1)
+    assert limiter.rate == 10
+
+    for _ in range(20):
+        limiter.on_response(503, 0.1)
+    assert limiter.rate == limiter.min_rate
+
+    # Retry-After is honoured
+    limiter.acquire()
+    limiter.on_response(429, 0.1, retry_after=30)
+    assert limiter.acquire() == pytest.approx(30 + 1 / limiter.rate)
+
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("garbage") is None
+
+
+def test_throttled_requests():
+    from campbot import CampBot
+    from campbot.throttling import AdaptiveRateLimiter
+    from requests import HTTPError
+
+    clock = FakeClock()
+    bot = CampBot(rate_limiter=AdaptiveRateLimiter(rate=4, clock=clock, sleep=clock.sleep))
+
+    responses = [FakeResponse(429, headers={"Retry-After": "60"}), FakeResponse(503), FakeResponse(200, {"ok": True})]
+    bot.wiki._session.request = lambda method, url, **kwargs: responses.pop(0)
+
+    assert bot.wiki.get("/routes/123") == {"ok": True}
+    assert bot.wiki.effective_rate == pytest.approx(1.2)
+    assert clock.now >= 60
+
+    bot.wiki._session.request = lambda method, url, **kwargs: FakeResponse(429)
+
+    with pytest.raises(HTTPError):
+        bot.wiki.get("/routes/123")
+
+
+def test_retry_policy():
+    from campbot.throttling import RetryPolicy
+    from requests import ConnectionError, HTTPError
+
+    clock = FakeClock()
+    policy = RetryPolicy(max_attempts=4, backoff=1, max_backoff=3, clock=clock, sleep=clock.sleep, seed=1)
+
+    errors = [ConnectionError(), ConnectionError(), ConnectionError()]
+
+    def func():
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    assert policy.call(func) == "ok"
+    assert len(clock.slept) == 3
+    assert all(0 <= delay <= limit for delay, limit in zip(clock.slept, [1, 2, 3]))
+
+    # not transient
+    def fail():
+        raise ValueError()
+
+    with pytest.raises(ValueError):
+        policy.call(fail)
+
+    assert len(clock.slept) == 3
+
+    # too many attempts
+    errors = [ConnectionError()] * 4
+    with pytest.raises(ConnectionError):
+        policy.call(func)
+
+    # deadline
+    policy = RetryPolicy(backoff=100, deadline=1, clock=clock, sleep=clock.sleep, seed=1)
+    errors = [ConnectionError()]
+    with pytest.raises(ConnectionError):
+        policy.call(func)
+
+    assert policy.is_transient(HTTPError(response=FakeResponse(502)))
+    assert not policy.is_transient(HTTPError(response=FakeResponse(404)))
+    assert not policy.is_transient(HTTPError())
+
+    # decision shared with async bot
+    policy = RetryPolicy(max_attempts=2, clock=clock, sleep=clock.sleep, seed=1)
+    assert policy.next_delay(1, policy.now(), ValueError()) is None
+    assert policy.next_delay(1, policy.now(), ValueError(), transient=True) is not None
+    assert policy.next_delay(2, policy.now(), ConnectionError()) is None
+
+
+def test_retried_requests():
+    from campbot import CampBot
+    from campbot.throttling import RetryPolicy
+    from requests import ConnectionError
+
+    clock = FakeClock()
+    bot = CampBot(min_delay=0, retry_policy=RetryPolicy(clock=clock, sleep=clock.sleep))
+
+    def request(method, url, **kwargs):
+        calls.append(method)
+        if len(calls) == 1:
+            raise ConnectionError()
+        return FakeResponse(200, {})
+
+    bot.wiki._session.request = request
+
+    calls = []
+    bot.wiki.get("/routes/123")
+    assert calls == ["GET", "GET"]
+
+    calls = []
+    with pytest.raises(ConnectionError):
+        bot.wiki.put("/routes/123", {})
+
+    calls = []
+    bot.wiki.retry_put = True
+    bot.wiki.put("/routes/123", {})
+    assert calls == ["PUT", "PUT"]